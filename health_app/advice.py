@@ -0,0 +1,82 @@
+import json
+
+from django.conf import settings
+
+from . import metrics
+from .utils import agenerate_ai_responses, generate_ai_responses
+
+# Advice comes from the cheapest tier that can answer: the advice cache, then the LLM for conditions
+# configured to use it while the circuit breaker and call budget allow, and otherwise the condition's
+# template filled in from the same summary features the LLM would have been sent. Templates are
+# plain str.format strings, so rendering one costs microseconds and never fails a request.
+
+
+class _Missing:
+    """Stands in for NULL features and unknown names, whatever format spec the template gives them."""
+
+    def __format__(self, spec):
+        return 'n/a'
+
+
+MISSING = _Missing()
+
+
+class _Values(dict):
+    def __missing__(self, key):
+        return MISSING
+
+
+def render(template, values):
+    return template.format_map(_Values({name: MISSING if value is None else value for name, value in values.items()}))
+
+
+def trend(change_pct):
+    """Wording for a week-over-week change, for templates to compare with "... the week before"."""
+    if change_pct is None or abs(change_pct) < 5:
+        return 'about the same as'
+    return 'more than' if change_pct > 0 else 'less than'
+
+
+def template_values(user, data):
+    """``user`` plus every summary feature, and a ``<metric>_trend`` word for each ``<metric>_change_pct``."""
+    features = json.loads(data) if isinstance(data, str) else dict(data)
+    values = {'user': user.username, **features}
+    for name, value in features.items():
+        if name.endswith('_change_pct'):
+            values[name[:-len('_change_pct')] + '_trend'] = trend(value)
+    return values
+
+
+def template_advice(rule):
+    """The rule's template as a ``(user, data) -> str`` fallback, or None if it has none."""
+    if rule.template is None:
+        return None
+    return lambda user, data: render(rule.template, template_values(user, data))
+
+
+def llm_enabled(rule):
+    return '*' in settings.AI_LLM_RULES or rule.name in settings.AI_LLM_RULES
+
+
+def _templates_only(items, rule):
+    fallback = template_advice(rule)
+    if fallback is None or llm_enabled(rule):
+        return None
+    metrics.ai_template_responses.inc(len(items), reason='disabled')
+    return [fallback(user, data) for user, data in items]
+
+
+def advise(items, rule, complete=None):
+    """Advice for a condition's ``(user, summary JSON)`` pairs, in input order, from the cheapest tier."""
+    templated = _templates_only(items, rule)
+    if templated is not None:
+        return templated
+    return generate_ai_responses(items, rule.topic, complete, fallback=template_advice(rule))
+
+
+async def aadvise(items, rule, complete=None):
+    """advise() for async views."""
+    templated = _templates_only(items, rule)
+    if templated is not None:
+        return templated
+    return await agenerate_ai_responses(items, rule.topic, complete, fallback=template_advice(rule))
@@ -0,0 +1,224 @@
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import connections
+from django.utils import timezone
+
+from .models import DailyUserMetrics
+from .routers import from_replica
+from .summaries import SLEEP_GOAL, STEP_GOAL
+
+# Long-range trends and correlations are computed on dense (users x days) arrays, one per rollup
+# column, loaded from DailyUserMetrics in a single query. Every statistic is then a handful of
+# whole-array NumPy operations across all users at once, with no Python loop over users or days.
+# Days without a rollup row are NaN and are left out of means, correlations and goal streaks: a
+# streak counts logged days that met the goal, and an unlogged day neither extends nor breaks it.
+# That differs from summaries.py, whose *_goal_streak_days count calendar days since the last miss,
+# so the streak features here are named *_goal_streak_logged_days.
+
+COLUMNS = ('steps', 'sleep_seconds', 'heart_rate', 'active_energy', 'basal_energy')
+
+# Fewer days than this in common and a correlation or comparison is reported as NaN.
+MIN_DAYS = 7
+
+LOAD_CHUNK_SIZE = 100_000
+
+
+class History:
+    """Daily metrics of many users as one float32 ``(users, days)`` array per rollup column.
+
+    Row ``i`` of every array belongs to ``user_ids[i]`` (ascending) and column ``j`` to ``start + j`` days.
+    """
+
+    def __init__(self, user_ids, start, columns):
+        self.user_ids = user_ids
+        self.start = start
+        self.columns = columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @property
+    def days(self):
+        return self.columns[COLUMNS[0]].shape[1]
+
+    def index(self, user_id):
+        """Row of ``user_id``, or None if it has no rollup rows in the window."""
+        position = np.searchsorted(self.user_ids, user_id)
+        if position < len(self.user_ids) and self.user_ids[position] == user_id:
+            return int(position)
+        return None
+
+
+def load_history(days=365, today=None, users=None):
+    """Load the last ``days`` days (today included) of every user's rollup rows into a History.
+
+    ``users`` (a queryset or list of ids) restricts the load; users with no rows in the window are
+    absent from the result. Rows are read in chunks from one query and only kept as compact arrays,
+    so memory stays close to the size of the final arrays. They are fetched straight from the
+    cursor, as the ORM's per-row handling would cost as much as the query itself.
+    """
+    today = today or timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    rows = DailyUserMetrics.objects.filter(date__gte=start, date__lte=today)
+    if users is not None:
+        rows = rows.filter(user__in=users)
+    rows = from_replica(rows).values_list('user_id', 'date', *COLUMNS)
+    sql, params = rows.query.sql_with_params()
+
+    user_chunks, day_chunks, value_chunks = [], [], []
+    with connections[rows.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        while chunk := cursor.fetchmany(LOAD_CHUNK_SIZE):
+            user_column, date_column, *values = zip(*chunk)
+            user_chunks.append(np.array(user_column, dtype=np.int64))
+            # date.toordinal is far cheaper than numpy's own conversion of date objects.
+            day_chunks.append(np.fromiter(map(date.toordinal, date_column), np.int32, len(chunk)) - start.toordinal())
+            # NULL heart rates become NaN in the float conversion.
+            value_chunks.append(np.array(values, dtype=np.float32))
+
+    if not user_chunks:
+        empty = np.empty((0, days), dtype=np.float32)
+        return History(np.empty(0, dtype=np.int64), start, {name: empty.copy() for name in COLUMNS})
+    user_ids, rows_of = np.unique(np.concatenate(user_chunks), return_inverse=True)
+    day = np.concatenate(day_chunks)
+    values = np.concatenate(value_chunks, axis=1)
+    columns = {}
+    for position, name in enumerate(COLUMNS):
+        matrix = np.full((len(user_ids), days), np.nan, dtype=np.float32)
+        matrix[rows_of, day] = values[position]
+        columns[name] = matrix
+    return History(user_ids, start, columns)
+
+
+def _window_sum(values, window):
+    total = np.cumsum(values, axis=1, dtype=np.float64)
+    total[:, window:] = total[:, window:] - total[:, :-window]
+    return total
+
+
+def rolling_mean(values, window=7):
+    """Mean of each user's last ``window`` days at every day, ignoring missing days.
+
+    NaN where the whole window is missing.
+    """
+    present = ~np.isnan(values)
+    sums = _window_sum(np.where(present, values, 0), window)
+    counts = _window_sum(present, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts).astype(np.float32)
+
+
+def window_mean(values, days, offset=0):
+    """Each user's mean over the ``days`` days ending ``offset`` days before the last, ignoring missing days.
+
+    Slicing the window is much cheaper than a rolling_mean() when only the latest value is needed.
+    """
+    end = values.shape[1] - offset
+    return _masked_mean(values[:, max(end - days, 0):end], True, min_days=1)
+
+
+def _change_pct(current, previous):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+
+
+def week_over_week(values):
+    """Percent change of each day's 7-day mean over the 7 days before it; the last column is this week's.
+
+    NaN for the first week, and where either week has no data or the earlier one averaged zero.
+    """
+    means = rolling_mean(values, 7)
+    change = np.full_like(means, np.nan)
+    change[:, 7:] = _change_pct(means[:, 7:], means[:, :-7])
+    return change
+
+
+def streaks(met, logged=True):
+    """``(current, longest)`` run of consecutive True days per user; current runs end on the last day.
+
+    Days where ``logged`` is False are skipped: they neither extend nor break a run.
+    """
+    met = met & logged
+    total = np.cumsum(met, axis=1, dtype=np.int32)
+    # Count of True days up to the latest miss, carried forward; subtracting it restarts the count.
+    at_last_miss = np.maximum.accumulate(np.where(logged & ~met, total, 0), axis=1)
+    runs = total - at_last_miss
+    return runs[:, -1], runs.max(axis=1, initial=0)
+
+
+def correlation(x, y):
+    """Pearson correlation of ``x`` and ``y`` per user, over the days both are present."""
+    both = ~(np.isnan(x) | np.isnan(y))
+    days = both.sum(axis=1)
+
+    def centred(values):
+        mean = np.where(both, values, 0).sum(axis=1, dtype=np.float64) / days
+        return np.where(both, values - mean.astype(np.float32)[:, None], 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx, dy = centred(x), centred(y)
+        r = (dx * dy).sum(axis=1, dtype=np.float64) / np.sqrt(
+            (dx * dx).sum(axis=1, dtype=np.float64) * (dy * dy).sum(axis=1, dtype=np.float64)
+        )
+    r[days < MIN_DAYS] = np.nan
+    return r
+
+
+def _masked_mean(values, mask, min_days=MIN_DAYS):
+    present = mask & ~np.isnan(values)
+    days = present.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(present, values, 0).sum(axis=1, dtype=np.float64) / days
+    mean[days < min_days] = np.nan
+    return mean
+
+
+def sleep_after_active_days(steps, sleep):
+    """Percent more sleep on nights after a user's above-average step days than after their other days.
+
+    A night's sleep is logged on the morning it ends, so a day's steps are paired with the next day's sleep.
+    """
+    steps, sleep = steps[:, :-1], sleep[:, 1:]
+    logged = ~np.isnan(steps)
+    # Comparing with NaN (no steps that day, or none at all) is False, so those days are in neither group.
+    with np.errstate(invalid='ignore'):
+        active = steps > _masked_mean(steps, True, min_days=1)[:, None]
+    return _change_pct(_masked_mean(sleep, active), _masked_mean(sleep, logged & ~active))
+
+
+def insights(history):
+    """Per-user feature arrays, aligned with ``history.user_ids``."""
+    steps, sleep = history['steps'], history['sleep_seconds']
+    step_streak, longest_step_streak = streaks(steps >= STEP_GOAL, ~np.isnan(steps))
+    sleep_streak, longest_sleep_streak = streaks(sleep >= SLEEP_GOAL, ~np.isnan(sleep))
+    return {
+        'steps_avg_30d': window_mean(steps, 30),
+        'sleep_hours_avg_30d': window_mean(sleep, 30) / 3600,
+        'heart_rate_avg_30d': window_mean(history['heart_rate'], 30),
+        'steps_change_pct': _change_pct(window_mean(steps, 7), window_mean(steps, 7, offset=7)),
+        'sleep_hours_change_pct': _change_pct(window_mean(sleep, 7), window_mean(sleep, 7, offset=7)),
+        'step_goal_streak_logged_days': step_streak,
+        'longest_step_goal_streak_logged_days': longest_step_streak,
+        'sleep_goal_streak_logged_days': sleep_streak,
+        'longest_sleep_goal_streak_logged_days': longest_sleep_streak,
+        'step_sleep_correlation': correlation(steps[:, :-1], sleep[:, 1:]),
+        'sleep_after_active_days_pct': sleep_after_active_days(steps, sleep),
+    }
+
+
+def user_insights(history):
+    """insights() as ``{user_id: {feature: value}}``, rounded for a prompt, with None for NaN."""
+    features = insights(history)
+    rounded = {
+        name: np.round(values, 2 if name == 'step_sleep_correlation' else 1).tolist()
+        for name, values in features.items()
+    }
+    # NaN is the only value not equal to itself.
+    return {
+        user_id: {name: None if values[row] != values[row] else values[row] for name, values in rounded.items()}
+        for row, user_id in enumerate(history.user_ids.tolist())
+    }
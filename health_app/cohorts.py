@@ -0,0 +1,277 @@
+from datetime import timedelta
+import heapq
+from functools import reduce
+from itertools import groupby
+from operator import itemgetter, or_
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Avg, BooleanField, Count, ExpressionWrapper, F, FilteredRelation, FloatField, IntegerField, Max, OuterRef, Q,
+    Subquery, Sum,
+)
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .models import CohortEvaluation, CohortMembership, DailyUserMetrics, MonthlyUserMetrics
+from .routers import from_replica
+
+# Cohort rules are declared as named aggregates over the DailyUserMetrics rollup plus a condition on
+# them, and compile to one grouped query: a single join on the user's rollup rows, bounded by the
+# widest window any term needs, with one conditional aggregate per term. Adding a rule adds no code
+# paths, and evaluating N rules costs N queries however many users there are.
+
+WINDOW = 'rule_window'
+
+
+class Term:
+    """An aggregate of one rollup column over a window of days.
+
+    The window covers ``days`` days ending ``offset`` days before today (``days=None`` means all
+    history). ``where`` adds lookups on the rollup row, e.g. ``{'sleep_seconds__gte': 8 * 3600}``, and
+    ``default`` replaces NULL when the user has no matching rows.
+
+    Lifetime terms can name the MonthlyUserMetrics column that holds the same quantity for history
+    already compacted by health_app.retention (``archived``); it is folded in with a per-user subquery.
+    """
+
+    def __init__(self, metric, aggregate, days=7, offset=0, where=None, default=None, archived=None):
+        if archived and days is not None:
+            raise ValueError('Only lifetime terms (days=None) can include compacted history')
+        self.metric = metric
+        self.aggregate = aggregate
+        self.days = days
+        self.offset = offset
+        self.where = where or {}
+        self.default = default
+        self.archived = archived
+
+    def window(self, today):
+        end = today - timedelta(days=self.offset)
+        start = None if self.days is None else end - timedelta(days=self.days - 1)
+        return start, end
+
+    def as_expression(self, today, join_window=(None, None)):
+        # Bounds the join already applies are left out of the FILTER clause.
+        start, end = self.window(today)
+        bounds = Q()
+        if end != join_window[1]:
+            bounds &= Q(**{f'{WINDOW}__date__lte': end})
+        if start is not None and start != join_window[0]:
+            bounds &= Q(**{f'{WINDOW}__date__gte': start})
+        for lookup, value in self.where.items():
+            bounds &= Q(**{f'{WINDOW}__{lookup}': value})
+        expression = self.aggregate(f'{WINDOW}__{self.metric}', filter=bounds or None)
+        if self.archived:
+            expression = self.with_archived(expression)
+        return expression if self.default is None else Coalesce(expression, self.default)
+
+    def with_archived(self, expression):
+        monthly = MonthlyUserMetrics.objects.filter(user=OuterRef('pk')).values('user')
+        if self.aggregate is Max:
+            # Live rollup rows are always newer than compacted months.
+            return Coalesce(expression, CompactedTotal(monthly.annotate(total=Max(self.archived)).values('total')))
+        compacted = CompactedTotal(monthly.annotate(total=Sum(self.archived)).values('total'), template='COALESCE((%(subquery)s), 0)')
+        return Coalesce(expression, 0) + compacted
+
+    def output_field(self):
+        if self.aggregate is Count:
+            return IntegerField()
+        if self.aggregate is Avg:
+            return FloatField()
+        return DailyUserMetrics._meta.get_field(self.metric).clone()
+
+
+class CompactedTotal(Subquery):
+    """A user's total from MonthlyUserMetrics. It only depends on the grouped user id, so it is kept out
+    of the GROUP BY, where it would be evaluated once per joined row."""
+
+    def get_group_by_cols(self):
+        return []
+
+
+def covering_window(terms, today):
+    """The smallest (start, end) window containing every term's window; start is None for all history."""
+    windows = [term.window(today) for term in terms]
+    starts = [start for start, _ in windows]
+    return (None if None in starts else min(starts)), max(end for _, end in windows)
+
+
+def with_terms(users, terms, today):
+    """Annotate ``users`` with ``terms`` (alias -> Term) over one join on their rollup rows."""
+    join_window = covering_window(terms.values(), today)
+    # The join is bounded in its ON clause so the (user, date) index drives the lookup.
+    condition = Q(daily_metrics__date__lte=join_window[1])
+    if join_window[0] is not None:
+        condition &= Q(daily_metrics__date__gte=join_window[0])
+    return users.annotate(
+        **{WINDOW: FilteredRelation('daily_metrics', condition=condition)}
+    ).annotate(
+        **{alias: term.as_expression(today, join_window) for alias, term in terms.items()}
+    )
+
+
+def _users(fields=None):
+    users = get_user_model().objects
+    return users.all() if fields is None else users.values(*fields)
+
+
+class Rule:
+    """A named cohort: ``terms`` are annotated on every user and ``where`` filters on them.
+
+    Rules with a ``topic`` are health conditions that get LLM advice for their members. ``template``
+    is the str.format message used instead of the LLM (see health_app.advice).
+    """
+
+    def __init__(self, name, terms, where, topic=None, template=None):
+        self.name = name
+        self.terms = terms
+        self.where = where
+        self.topic = topic
+        self.template = template
+
+    def queryset(self, today=None, fields=None):
+        """Users matching the rule, annotated with its terms.
+
+        With ``fields``, rows are dicts of those user fields plus the terms, and only those fields are
+        selected and grouped on.
+        """
+        today = today or timezone.localdate()
+        return from_replica(with_terms(_users(fields), self.terms, today).filter(self.where).order_by('pk'))
+
+    def members(self, today=None, fields=None):
+        """The cohort as persisted by the last batch evaluation, or the live query if that is stale.
+
+        Persisted members carry the same term annotations, cast back from the stored JSON. ``fields``
+        works as for queryset().
+        """
+        today = today or timezone.localdate()
+        if not self._evaluation(today).exists():
+            return self.queryset(today, fields)
+        return self._persisted(fields)
+
+    async def amembers(self, today=None, fields=None):
+        """members() for async views: the freshness check runs on the async ORM."""
+        today = today or timezone.localdate()
+        if not await self._evaluation(today).aexists():
+            return self.queryset(today, fields)
+        return self._persisted(fields)
+
+    def _evaluation(self, today):
+        return from_replica(CohortEvaluation.objects.filter(
+            rule=self.name, evaluated_on=today,
+            evaluated_at__gte=timezone.now() - timedelta(seconds=settings.COHORT_MAX_AGE),
+        ))
+
+    def _persisted(self, fields):
+        return from_replica(_users(fields).filter(cohort_memberships__rule=self.name).alias(
+            cohort_values=F('cohort_memberships__values'),
+        ).annotate(**{
+            name: Cast(KT(f'cohort_values__{name}'), term.output_field())
+            for name, term in self.terms.items()
+        }).order_by('pk'))
+
+
+RULES = {}
+
+
+def register(rule):
+    RULES[rule.name] = rule
+    return rule
+
+
+def _relabel(value, prefix):
+    """Rewrite a rule condition so the term names it references point at their prefixed aliases."""
+    if isinstance(value, Q):
+        children = [
+            _relabel(child, prefix) if isinstance(child, Q) else (prefix + child[0], _relabel(child[1], prefix))
+            for child in value.children
+        ]
+        return Q(*children, _connector=value.connector, _negated=value.negated)
+    if isinstance(value, F):
+        return F(prefix + value.name)
+    if hasattr(value, 'get_source_expressions'):
+        value = value.copy()
+        value.set_source_expressions([_relabel(source, prefix) for source in value.get_source_expressions()])
+    return value
+
+
+def _iter_flags(rules, today, chunk_size):
+    terms, flags, aliases = {}, {}, []
+    for index, rule in enumerate(rules):
+        prefix = f'r{index}_'
+        terms.update({prefix + name: term for name, term in rule.terms.items()})
+        flags[f'r{index}'] = _relabel(rule.where, prefix)
+        aliases.append([(name, prefix + name) for name in rule.terms])
+
+    # Grouping by the primary key alone keeps the other user columns out of the GROUP BY.
+    users = from_replica(with_terms(get_user_model().objects.values('pk'), terms, today)).annotate(**{
+        flag: ExpressionWrapper(condition, output_field=BooleanField()) for flag, condition in flags.items()
+    }).filter(reduce(or_, flags.values())).order_by('pk')
+    columns = ['pk', *flags, *terms]
+
+    last_pk = None
+    while True:
+        page = users if last_pk is None else users.filter(pk__gt=last_pk)
+        rows = list(page.values(*columns)[:chunk_size])
+        for row in rows:
+            yield row['pk'], {
+                rule.name: {name: row[alias] for name, alias in aliases[index]}
+                for index, rule in enumerate(rules) if row[f'r{index}']
+            }
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1]['pk']
+
+
+def iter_memberships(rules=None, today=None, chunk_size=5000):
+    """Evaluate several rules together over id-ordered chunks of users.
+
+    Yields ``(user_id, {rule name: {term: value}})`` for every user in at least one cohort. Rules
+    share one join on the rollup; their terms are aliased apart and each condition becomes a boolean
+    column. Rules over recent windows and rules over all history are evaluated as two passes, so the
+    recent ones never aggregate a user's full history, and the passes are merged by user id.
+    """
+    rules = list(RULES.values() if rules is None else rules)
+    today = today or timezone.localdate()
+    passes = {}
+    for rule in rules:
+        lifetime = covering_window(rule.terms.values(), today)[0] is None
+        passes.setdefault(lifetime, []).append(rule)
+
+    streams = [_iter_flags(group, today, chunk_size) for group in passes.values()]
+    merged = heapq.merge(*streams, key=itemgetter(0))
+    for user_id, memberships in groupby(merged, key=itemgetter(0)):
+        yield user_id, {name: values for _, found in memberships for name, values in found.items()}
+
+
+def evaluate_all(rules=None, today=None):
+    """Per-user membership map: user id -> set of rule names, for users in any cohort."""
+    return {user_id: set(memberships) for user_id, memberships in iter_memberships(rules, today)}
+
+
+def persist_memberships(rules=None, today=None, chunk_size=5000):
+    """Replace the stored members of ``rules`` with a fresh batch evaluation; returns rule -> size."""
+    rules = list(RULES.values() if rules is None else rules)
+    today = today or timezone.localdate()
+    sizes = {rule.name: 0 for rule in rules}
+    with transaction.atomic():
+        CohortMembership.objects.filter(rule__in=sizes).delete()
+        batch = []
+        for user_id, memberships in iter_memberships(rules, today, chunk_size):
+            for name, values in memberships.items():
+                batch.append(CohortMembership(rule=name, user_id=user_id, values=values))
+                sizes[name] += 1
+            if len(batch) >= chunk_size:
+                CohortMembership.objects.bulk_create(batch)
+                batch = []
+        CohortMembership.objects.bulk_create(batch)
+
+        now = timezone.now()
+        CohortEvaluation.objects.bulk_create(
+            [CohortEvaluation(rule=name, evaluated_on=today, evaluated_at=now, members=size) for name, size in sizes.items()],
+            update_conflicts=True, unique_fields=['rule'], update_fields=['evaluated_on', 'evaluated_at', 'members'],
+        )
+    return sizes
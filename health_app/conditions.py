@@ -0,0 +1,70 @@
+from django.db.models import Count, F, Max, Q, Sum
+
+from .cohorts import RULES, Rule, Term, register
+from .models import PERFECT_SLEEP_SECONDS
+
+register(Rule(
+    'sleep',
+    terms={'weekly_sleep': Term('sleep_seconds', Sum, days=7, default=0)},
+    where=Q(weekly_sleep__lt=7 * 6 * 3600),  # 6 hours a night, in seconds
+    topic="Users with a week of sleep less than 6 hours.",
+    # Templates see the summary features from health_app.summaries plus a <metric>_trend word.
+    template=(
+        "Hello, {user}. You slept {sleep_hours_avg_7d} hours a night on average this week, {sleep_hours_trend} "
+        "the week before. Most adults need 7 to 9 hours, so try winding down half an hour earlier tonight. "
+        "You logged {days_logged_7d} of the last 7 days; keep it up!"
+    ),
+))
+
+register(Rule(
+    'steps1',
+    terms={'steps_today': Term('steps', Max, days=1)},
+    where=Q(steps_today__gte=10000),
+    topic="Users who have reached 10,000 steps today.",
+    template=(
+        "Hello, {user}. You walked {steps_today:,} steps today, so you reached your 10,000 step goal! "
+        "That makes {step_goal_streak_days} days in a row. Keep it up and continue in the same spirit."
+    ),
+))
+
+register(Rule(
+    'steps2',
+    terms={
+        'steps_this_week': Term('steps', Sum, days=7),
+        'steps_last_week': Term('steps', Sum, days=7, offset=7),
+    },
+    where=Q(steps_this_week__lt=F('steps_last_week') / 2),
+    topic="Users who walked 50% less this week compared to the previous week.",
+    template=(
+        "Hello, {user}. You averaged {steps_avg_7d:,.0f} steps a day this week, down from {steps_avg_prev_7d:,.0f} "
+        "the week before. A ten minute walk after each meal adds about 3,000 steps, so you can get back on track!"
+    ),
+))
+
+# Users who have not synced today, with lifetime totals for the win-back message. The totals include
+# months compacted into MonthlyUserMetrics, so they survive retention. last_seen is NULL
+# for users without any stats; defaulting it to date_joined in SQL would add a per-row date cast to
+# the GROUP BY, so readers fall back to date_joined themselves.
+register(Rule(
+    'absent',
+    terms={
+        'days_synced_today': Term('date', Count, days=1),
+        'last_seen': Term('date', Max, days=None, archived='last_date'),
+        'total_steps': Term('steps', Sum, days=None, default=0, archived='steps'),
+        'total_calories': Term('active_energy', Sum, days=None, default=0, archived='active_energy'),
+        'perfect_sleep_nights': Term(
+            'date', Count, days=None, where={'sleep_seconds__gte': PERFECT_SLEEP_SECONDS}, archived='perfect_sleep_nights',
+        ),
+    },
+    where=Q(days_synced_today=0),
+    # Rendered by AbsentUsersAPIView with days_absent added to the term values.
+    template=(
+        "It’s been {days_absent} days since we last saw you. During this period that you were with us "
+        "you walked more than {total_steps} steps, burned {total_calories} calories and had "
+        "{perfect_sleep_nights} nights of perfect sleep. Your wellness journey is important to us, "
+        "continue the path to self-improvement in Hapday. Let’s catch up!"
+    ),
+))
+
+# Health conditions that get AI advice: name -> rule with the topic sent to the LLM.
+CONDITIONS = {name: rule for name, rule in RULES.items() if rule.topic}
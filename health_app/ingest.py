@@ -0,0 +1,269 @@
+import json
+import time
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from health_app.models import AppleHealthStat, total_sleep_seconds
+from health_app.queries import start_of_day
+from health_app.rollups import catch_up
+from health_app.serializers import AppleHealthStatIngestSerializer
+
+# Apple Health quantity records summed into one daily value.
+DAILY_SUMS = {
+    'HKQuantityTypeIdentifierStepCount': 'stepCount',
+    'HKQuantityTypeIdentifierActiveEnergyBurned': 'activeEnergyBurned',
+    'HKQuantityTypeIdentifierBasalEnergyBurned': 'basalEnergyBurned',
+    'HKQuantityTypeIdentifierFlightsClimbed': 'flightsClimbed',
+    'HKQuantityTypeIdentifierAppleExerciseTime': 'appleExerciseTime',
+    'HKQuantityTypeIdentifierAppleMoveTime': 'appleMoveTime',
+}
+# Quantity records averaged over the day; fractions (e.g. 0.97 SpO2) are stored as percentages.
+DAILY_MEANS = {
+    'HKQuantityTypeIdentifierHeartRate': 'heartRate',
+    'HKQuantityTypeIdentifierOxygenSaturation': 'oxygenSaturation',
+}
+# Body measurements where the last reading of the day wins.
+DAILY_LATEST = {
+    'HKQuantityTypeIdentifierBodyMass': 'bodyMass',
+    'HKQuantityTypeIdentifierHeight': 'height',
+    'HKQuantityTypeIdentifierBodyFatPercentage': 'bodyFatPercentage',
+}
+PERCENT_FIELDS = {'oxygenSaturation', 'bodyFatPercentage'}
+ASLEEP_VALUES = {
+    'HKCategoryValueSleepAnalysisAsleep',
+    'HKCategoryValueSleepAnalysisAsleepUnspecified',
+    'HKCategoryValueSleepAnalysisAsleepCore',
+    'HKCategoryValueSleepAnalysisAsleepDeep',
+    'HKCategoryValueSleepAnalysisAsleepREM',
+}
+EXPORT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S %z'
+
+UPDATE_FIELDS = [
+    field.name for field in AppleHealthStat._meta.concrete_fields
+    if field.name not in ('id', 'user', 'created_at')
+]
+
+
+class MalformedInput(ValueError):
+    """The input cannot be read any further, e.g. a truncated export.xml."""
+
+
+class InvalidRecord:
+    """Stands in for a source record the parser could not read, so ingest() counts it as rejected."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class IngestResult:
+    MAX_ERRORS = 100
+
+    def __init__(self):
+        self.received = 0
+        self.written = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []
+        self.error = None
+        self.elapsed = 0.0
+
+    def reject(self, number, error):
+        self.rejected += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append({'record': number, 'error': error})
+
+    def as_dict(self):
+        return {
+            'received': self.received,
+            'written': self.written,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'error': self.error,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.written / self.elapsed) if self.elapsed else None,
+        }
+
+
+def parse_ndjson(lines):
+    """Yield one record per non-blank line.
+
+    Lines that are not JSON are passed through and rejected by validation; lines that are not
+    UTF-8 are yielded as InvalidRecord.
+    """
+    for line in lines:
+        try:
+            if isinstance(line, bytes):
+                line = line.decode()
+        except UnicodeDecodeError as exc:
+            yield InvalidRecord(f'not UTF-8: {exc}')
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+def parse_export_xml(source, username):
+    """Stream an Apple Health ``export.xml`` into one daily record per day for ``username``.
+
+    Elements are cleared as soon as they are read, so memory grows with the number of days
+    in the export rather than the number of records. Records that cannot be read (e.g. an
+    unparseable date) are yielded as InvalidRecord; a document that is not well-formed raises
+    MalformedInput before any day is yielded, as the days read so far may be incomplete.
+    """
+    days = defaultdict(dict)
+    means = defaultdict(lambda: [0.0, 0])
+    profile = {}
+    depth = 0
+    root = None
+
+    try:
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                root = root if root is not None else elem
+                continue
+            depth -= 1
+            try:
+                if elem.tag == 'Me':
+                    _add_profile(elem, profile)
+                elif elem.tag == 'Record':
+                    _add_record(elem, days, means)
+            except (TypeError, ValueError) as exc:
+                yield InvalidRecord(f"{elem.get('type') or elem.tag}: {exc}")
+            if depth == 1:
+                root.clear()
+    except ET.ParseError as exc:
+        raise MalformedInput(f'export.xml is not well-formed: {exc}') from exc
+
+    for (day, field), (total, count) in means.items():
+        days[day][field] = round(total / count)
+    for day in sorted(days):
+        record = {**profile, **days[day]}
+        if 'sleep_time' in record:
+            record['sleepAnalysis'] = [{'date': day.isoformat(), 'sleep_time': record.pop('sleep_time')}]
+        for field, value in record.items():
+            if isinstance(value, float):
+                record[field] = round(value)
+        yield {'user': username, 'created_at': start_of_day(day).isoformat(), **record}
+
+
+def _add_profile(elem, profile):
+    birth = elem.get('HKCharacteristicTypeIdentifierDateOfBirth')
+    if birth:
+        profile['dateOfBirth'] = start_of_day(datetime.strptime(birth, '%Y-%m-%d').date()).isoformat()
+    sex = elem.get('HKCharacteristicTypeIdentifierBiologicalSex', '')
+    if sex.startswith('HKBiologicalSex') and sex != 'HKBiologicalSexNotSet':
+        profile['biologicalSex'] = sex[len('HKBiologicalSex'):].lower()
+
+
+def _add_record(elem, days, means):
+    kind = elem.get('type')
+    start = datetime.strptime(elem.get('startDate'), EXPORT_DATE_FORMAT)
+    day = start.date()
+
+    if kind == 'HKCategoryTypeIdentifierSleepAnalysis':
+        if elem.get('value') in ASLEEP_VALUES:
+            end = datetime.strptime(elem.get('endDate'), EXPORT_DATE_FORMAT)
+            # Sleep counts towards the day it ends on.
+            stats = days[end.date()]
+            stats['sleep_time'] = stats.get('sleep_time', 0.0) + (end - start).total_seconds()
+        return
+    if kind == 'HKCategoryTypeIdentifierAppleStandHour':
+        if elem.get('value') == 'HKCategoryValueAppleStandHourStood':
+            days[day]['appleStandHour'] = days[day].get('appleStandHour', 0) + 1
+        return
+
+    try:
+        value = float(elem.get('value'))
+    except (TypeError, ValueError):
+        return
+    field = DAILY_SUMS.get(kind) or DAILY_MEANS.get(kind) or DAILY_LATEST.get(kind)
+    if field is None:
+        return
+    if field in PERCENT_FIELDS and value <= 1:
+        value *= 100
+    if field == 'height' and elem.get('unit') == 'm':
+        value *= 100
+
+    if kind in DAILY_SUMS:
+        days[day][field] = days[day].get(field, 0.0) + value
+    elif kind in DAILY_MEANS:
+        mean = means[(day, field)]
+        mean[0] += value
+        mean[1] += 1
+        days[day].setdefault(field, None)
+    else:
+        days[day][field] = value
+
+
+def ingest(records, batch_size=1000):
+    """Validate ``records`` and upsert them into AppleHealthStat in batches, deduplicating on (user, created_at).
+
+    Invalid records are counted and reported rather than aborting the load. If the input itself
+    becomes unreadable (MalformedInput), the records before that point are still written and the
+    problem is reported as ``error``. The daily rollup is caught up once at the end.
+    """
+    result = IngestResult()
+    started = time.perf_counter()
+    batch = []
+    try:
+        for number, record in enumerate(records, 1):
+            batch.append((number, record))
+            if len(batch) >= batch_size:
+                _write_batch(batch, result)
+                batch = []
+    except MalformedInput as exc:
+        result.error = str(exc)
+    if batch:
+        _write_batch(batch, result)
+    result.elapsed = time.perf_counter() - started
+    if result.written:
+        catch_up()
+    return result
+
+
+def _write_batch(batch, result):
+    result.received += len(batch)
+    # One serializer validates the whole batch; building its fields per record costs more than the write.
+    serializer = AppleHealthStatIngestSerializer()
+    valid = []
+    for number, record in batch:
+        if isinstance(record, InvalidRecord):
+            result.reject(number, record.error)
+            continue
+        try:
+            valid.append((number, serializer.run_validation(record)))
+        except ValidationError as exc:
+            result.reject(number, exc.detail)
+
+    usernames = {data['user'] for _, data in valid}
+    user_ids = dict(get_user_model().objects.filter(username__in=usernames).values_list('username', 'pk'))
+
+    # Later records for the same (user, created_at) replace earlier ones, within and across batches.
+    stats = {}
+    for number, data in valid:
+        user_id = user_ids.get(data.pop('user'))
+        if user_id is None:
+            result.reject(number, {'user': ['Unknown user.']})
+            continue
+        key = (user_id, data['created_at'])
+        if key in stats:
+            result.duplicates += 1
+        stats[key] = AppleHealthStat(user_id=user_id, sleep_seconds=total_sleep_seconds(data.get('sleepAnalysis')), **data)
+
+    with transaction.atomic():
+        AppleHealthStat.objects.bulk_create(
+            stats.values(), update_conflicts=True,
+            unique_fields=['user', 'created_at'], update_fields=UPDATE_FIELDS,
+        )
+    result.written += len(stats)
@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .advice import advise
+from .conditions import CONDITIONS
+from .models import AdviceJob, AdviceResult
+from .summaries import summarized_items
+
+
+def claim_next_job():
+    """Atomically take the oldest pending job, or a running one whose worker stopped reporting progress.
+
+    The claim is a conditional UPDATE, so several worker processes can share the queue without
+    row locks (which SQLite does not support).
+    """
+    stale = timezone.now() - timedelta(seconds=settings.AI_JOB_STALE_AFTER)
+    candidates = AdviceJob.objects.filter(status=AdviceJob.PENDING) | AdviceJob.objects.filter(
+        status=AdviceJob.RUNNING, updated_at__lt=stale
+    )
+    for job in candidates.order_by('created_at')[:10]:
+        claimed = AdviceJob.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status=AdviceJob.RUNNING, updated_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def process_job(job):
+    """Generate advice for the job's cohort in id-ordered chunks, saving results and progress per chunk.
+
+    Users that already have a result (from an interrupted run) are skipped, so a reclaimed job resumes.
+    """
+    rule = CONDITIONS[job.condition]
+    user_ids = list(rule.members().order_by('pk').values_list('pk', flat=True))
+    done = set(job.results.values_list('user_id', flat=True))
+    AdviceJob.objects.filter(pk=job.pk).update(total=len(user_ids), processed=len(done), updated_at=timezone.now())
+
+    User = get_user_model()
+    pending = [pk for pk in user_ids if pk not in done]
+    chunk_size = settings.AI_JOB_CHUNK_SIZE
+    try:
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            items = summarized_items(User.objects.filter(pk__in=chunk))
+            ai_responses = advise(items, rule)
+            with transaction.atomic():
+                AdviceResult.objects.bulk_create(
+                    [AdviceResult(job=job, user=user, ai_response=ai_response) for (user, _), ai_response in zip(items, ai_responses)],
+                    ignore_conflicts=True,
+                )
+                AdviceJob.objects.filter(pk=job.pk).update(processed=F('processed') + len(chunk), updated_at=timezone.now())
+    except Exception as e:
+        AdviceJob.objects.filter(pk=job.pk).update(status=AdviceJob.FAILED, error=str(e), updated_at=timezone.now())
+        raise
+
+    AdviceJob.objects.filter(pk=job.pk).update(status=AdviceJob.DONE, updated_at=timezone.now())
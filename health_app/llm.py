@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import weakref
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# The LLM client is built on first use rather than at import: the openai SDK alone takes most of a
+# second to import, which every manage.py command, test run and worker boot would otherwise pay.
+# One backend serves the whole process. Its HTTP transport keeps a bounded pool of keep-alive
+# connections, so calls after the first skip the TCP and TLS handshakes. AI_LLM_BACKEND names the
+# backend class, so a stub can stand in for the API.
+
+MODEL = "gpt-3.5-turbo-0125"
+
+
+def chat_messages(prompt):
+    return [
+        {"role": "system", "content": "You are a health advisor."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+class LLMBackend:
+    """What the advice pipeline needs from an LLM: the reply text for a prompt, sync and async.
+
+    ``timeout`` is in seconds and covers one attempt; retries are left to the caller.
+    """
+
+    def complete(self, prompt, timeout):
+        raise NotImplementedError
+
+    async def acomplete(self, prompt, timeout):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat completions over pooled keep-alive connections.
+
+    The sync client is shared by every thread. Async connections belong to the event loop that
+    opened them, so there is one async client per loop: one per ASGI worker, or one per request for
+    async views run under WSGI, each closed when its loop shuts down.
+    """
+
+    def __init__(self):
+        import httpx
+        import openai
+
+        self.httpx, self.openai = httpx, openai
+        self.client = openai.OpenAI(**self.client_options(), http_client=httpx.Client(**self.transport_options()))
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def client_options(self):
+        # The SDK's own retries are off: complete_with_retry shares the rate-limit gate across workers.
+        return {'api_key': settings.OPENAI_API_KEY, 'base_url': settings.OPENAI_BASE_URL, 'max_retries': 0}
+
+    def transport_options(self):
+        return {
+            'limits': self.httpx.Limits(
+                max_connections=settings.AI_HTTP_POOL_SIZE,
+                max_keepalive_connections=settings.AI_HTTP_POOL_SIZE,
+                keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            'timeout': self.httpx.Timeout(settings.AI_REQUEST_TIMEOUT, connect=settings.AI_CONNECT_TIMEOUT),
+        }
+
+    async def async_client(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            client = self.openai.AsyncOpenAI(
+                **self.client_options(), http_client=self.httpx.AsyncClient(**self.transport_options()),
+            )
+            # asyncio.run(), which async_to_sync also uses, closes the async generators still suspended
+            # on its loop before closing it; this one closes the client's connections on that loop.
+            closer = _close_on_shutdown(client)
+            await closer.__anext__()
+            self._async_clients[loop] = client, closer
+        return self._async_clients[loop][0]
+
+    def complete(self, prompt, timeout):
+        response = self.client.chat.completions.create(model=MODEL, messages=chat_messages(prompt), timeout=timeout)
+        return response.choices[0].message.content.strip()
+
+    async def acomplete(self, prompt, timeout):
+        client = await self.async_client()
+        response = await client.chat.completions.create(model=MODEL, messages=chat_messages(prompt), timeout=timeout)
+        return response.choices[0].message.content.strip()
+
+    def close(self):
+        # Async clients can only be closed on their own loop, so they are left to _close_on_shutdown.
+        self.client.close()
+
+
+async def _close_on_shutdown(client):
+    try:
+        yield
+    finally:
+        await client.close()
+
+
+class StubBackend(LLMBackend):
+    """Answers every prompt with the same text, without network access; for tests and local runs."""
+
+    response = 'Stub advice.'
+
+    def complete(self, prompt, timeout):
+        return self.response
+
+    async def acomplete(self, prompt, timeout):
+        return self.response
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The process-wide backend, built from AI_LLM_BACKEND on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.AI_LLM_BACKEND)()
+    return _backend
+
+
+def reset_backend():
+    """Close and drop the backend, so the next call builds one from the current settings."""
+    global _backend
+    with _backend_lock:
+        backend, _backend = _backend, None
+    if backend is not None:
+        backend.close()
@@ -0,0 +1,29 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from health_app.jobs import claim_next_job, process_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued advice jobs. Run several copies to form a worker pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=settings.AI_JOB_POLL_INTERVAL, help='Seconds to wait between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['burst']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Processing job {job.pk} ({job.condition})')
+            try:
+                process_job(job)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'Job {job.pk} failed: {e}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'Finished job {job.pk}'))
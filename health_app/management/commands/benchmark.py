@@ -0,0 +1,230 @@
+import inspect
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+from django.core import serializers
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from health_app import analytics, queries
+from health_app.conditions import RULES
+from health_app.models import AppleHealthStat, DailyUserMetrics
+from health_app.renderers import ORJSONRenderer
+from health_app.serializers import UserSerializer
+from health_app.urls import urlpatterns
+
+
+def stub_completion(prompt, timeout):
+    return 'Benchmark advice.'
+
+
+async def astub_completion(prompt, timeout):
+    return 'Benchmark advice.'
+
+
+def measure(func, repeat):
+    """Best wall time over ``repeat`` runs, plus the query count and peak traced memory of the last run."""
+    best = None
+    for _ in range(repeat):
+        caches['ai_responses'].clear()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        best = elapsed if best is None else min(best, elapsed)
+    return {'wall_time': round(best, 6), 'queries': len(ctx.captured_queries), 'peak_memory': peak}
+
+
+def query_functions():
+    return {
+        name: func for name, func in inspect.getmembers(queries, inspect.isfunction)
+        if name.startswith('get_') and func.__module__ == queries.__name__
+    }
+
+
+def endpoints():
+    # Routes that take URL parameters (e.g. job ids) need fixtures and write-only routes have no GET; both are skipped.
+    return {
+        pattern.name: reverse(pattern.name) for pattern in urlpatterns
+        if not pattern.pattern.converters and hasattr(pattern.callback.view_class, 'get')
+    }
+
+
+# Columns an advice prompt or API entry actually needs from a stats row.
+STAT_FIELDS = ['user_id', 'created_at', 'stepCount', 'sleep_seconds', 'activeEnergyBurned', 'heartRate']
+
+
+def serialization_paths():
+    """Ways of turning rows into JSON bytes: the old per-instance paths next to the lean ones.
+
+    Each value is ``(rows, serialize)``; ``rows`` counts the rows a call serializes.
+    """
+    week = AppleHealthStat.objects.filter(created_at__gte=queries.start_of_day(timezone.localdate() - timedelta(days=6)))
+    rule = RULES['absent']
+    terms = {name: name for name in rule.terms}
+    stats, members = week.count(), rule.queryset().count()
+    return {
+        # django.core.serializers builds every field of every instance.
+        'stats_django_serializers': (stats, lambda: serializers.serialize('json', week)),
+        'stats_values_drf_json': (stats, lambda: JSONRenderer().render(list(week.values(*STAT_FIELDS)))),
+        'stats_values_orjson': (stats, lambda: ORJSONRenderer().render(list(week.values(*STAT_FIELDS)))),
+        'cohort_instances_drf_json': (members, lambda: JSONRenderer().render([
+            {'user': user.username, **{name: getattr(user, name) for name in terms}} for user in rule.queryset()
+        ])),
+        'cohort_values_orjson': (members, lambda: ORJSONRenderer().render(
+            UserSerializer(rule.queryset(fields=['pk', 'username']), many=True, fields=terms).data
+        )),
+    }
+
+
+def analytics_paths(days):
+    """Loading the seeded rollup history into arrays, and computing every user's insights from it."""
+    rows = DailyUserMetrics.objects.count()
+    return {
+        'analytics_load_history': (rows, lambda: analytics.load_history(days)),
+        'analytics_user_insights': (rows, lambda: analytics.user_insights(analytics.load_history(days))),
+    }
+
+
+@contextmanager
+def throwaway_database():
+    """Point the default database at a fresh on-disk copy for the block, so the configured one is never touched."""
+    with tempfile.TemporaryDirectory() as directory:
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        original_name = test_settings.get('NAME')
+        test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Replicas are not seeded, so every read must go to the throwaway database.
+        replicas = override_settings(DATABASE_REPLICAS=[])
+        replicas.enable()
+        try:
+            yield
+        finally:
+            replicas.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = original_name
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def find_regressions(results, baseline, tolerance):
+    """Compare two result files: more queries than the baseline, or slower than ``tolerance`` times it."""
+    regressions = []
+    for scale, groups in results['scales'].items():
+        for group, metrics in groups.items():
+            for name, current in metrics.items():
+                previous = baseline.get('scales', {}).get(scale, {}).get(group, {}).get(name)
+                if previous is None:
+                    continue
+                if current['queries'] > previous['queries']:
+                    regressions.append(f"{scale} users, {name}: {previous['queries']} -> {current['queries']} queries")
+                if current['wall_time'] > previous['wall_time'] * tolerance:
+                    regressions.append(f"{scale} users, {name}: {previous['wall_time']:.3f}s -> {current['wall_time']:.3f}s")
+    return regressions
+
+
+def find_scaling_queries(results):
+    """Flag anything whose query count grows with the number of users, the signature of an N+1 loop."""
+    flagged = []
+    scales = sorted(results['scales'], key=int)
+    for smaller, larger in zip(scales, scales[1:]):
+        for group, metrics in results['scales'][larger].items():
+            for name, current in metrics.items():
+                previous = results['scales'][smaller][group].get(name)
+                if previous and current['queries'] > previous['queries']:
+                    flagged.append(f"{name}: {previous['queries']} queries at {smaller} users, {current['queries']} at {larger}")
+    return flagged
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every query function and endpoint against seeded datasets, with the LLM stubbed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000,100000', help='Comma-separated user counts to seed and benchmark')
+        parser.add_argument('--days', type=int, default=30, help='Days of history seeded per user')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the seeded data')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best wall time is kept')
+        parser.add_argument('--output', default='benchmark.json', help='File to write the JSON results to')
+        parser.add_argument('--compare', help='Earlier results file; exit with an error on regressions against it')
+        parser.add_argument('--tolerance', type=float, default=1.5, help='Allowed slowdown factor when comparing')
+
+    def handle(self, *args, **options):
+        results = {
+            'commit': current_commit(),
+            'created_at': timezone.now().isoformat(),
+            'days': options['days'],
+            'scales': {},
+        }
+        for scale in [int(value) for value in options['scales'].split(',')]:
+            self.stdout.write(f'Seeding {scale} users x {options["days"]} days')
+            results['scales'][str(scale)] = self.run_scale(scale, options)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+
+        problems = [f'query count grows with users: {line}' for line in find_scaling_queries(results)]
+        if options['compare']:
+            with open(options['compare']) as f:
+                problems += find_regressions(results, json.load(f), options['tolerance'])
+        if problems:
+            raise CommandError('Performance regressions:\n' + '\n'.join(problems))
+
+    def run_scale(self, scale, options):
+        with throwaway_database():
+            call_command('generate_random_users', count=scale, fast_hash=True, stdout=self.stdout)
+            call_command('generate_random_data', days=options['days'], seed=options['seed'], stdout=self.stdout)
+            return self.run_benchmarks(options['repeat'], options['days'])
+
+    def run_benchmarks(self, repeat, days):
+        measurements = {'queries': {}, 'endpoints': {}, 'serialization': {}, 'analytics': {}}
+        for name, func in query_functions().items():
+            measurements['queries'][name] = measure(lambda: list(func()), repeat)
+            self.report(name, measurements['queries'][name])
+
+        for name, (rows, serialize) in serialization_paths().items():
+            measurement = measure(serialize, repeat)
+            measurement['rows_per_sec'] = round(rows / measurement['wall_time'])
+            measurements['serialization'][name] = measurement
+            self.report(name, measurement)
+
+        for name, (rows, compute) in analytics_paths(days).items():
+            measurement = measure(compute, repeat)
+            measurement['rows_per_sec'] = round(rows / measurement['wall_time'])
+            measurements['analytics'][name] = measurement
+            self.report(name, measurement)
+
+        client = Client(HTTP_HOST='localhost')
+        with mock.patch('health_app.utils.chat_completion', stub_completion), \
+                mock.patch('health_app.utils.achat_completion', astub_completion):
+            for name, url in endpoints().items():
+                measurements['endpoints'][name] = measure(lambda: client.get(url), repeat)
+                self.report(url, measurements['endpoints'][name])
+        return measurements
+
+    def report(self, name, measurement):
+        rate = f" {measurement['rows_per_sec']:>9} rows/s" if 'rows_per_sec' in measurement else ''
+        self.stdout.write(
+            f"  {name:<40} {measurement['wall_time']:>9.3f}s {measurement['queries']:>6} queries "
+            f"{measurement['peak_memory'] / 2 ** 20:>8.1f} MiB{rate}"
+        )
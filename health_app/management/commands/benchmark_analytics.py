@@ -0,0 +1,55 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from health_app import analytics
+
+
+def synthetic_history(users, days, seed, missing=0.1):
+    """A History of random but plausible daily metrics, with ``missing`` of the days left unlogged."""
+    rng = np.random.default_rng(seed)
+    shape = (users, days)
+    steps = rng.gamma(4, 2000, shape).astype(np.float32)
+    columns = {
+        'steps': steps,
+        # Active days sleep a little longer, so the correlations have something to find.
+        'sleep_seconds': (rng.normal(7 * 3600, 3600, shape) + steps * 0.05).astype(np.float32),
+        'heart_rate': rng.normal(70, 8, shape).astype(np.float32),
+        'active_energy': (steps * 0.04 + rng.normal(0, 50, shape)).astype(np.float32),
+        'basal_energy': rng.normal(1600, 150, shape).astype(np.float32),
+    }
+    unlogged = rng.random(shape) < missing
+    for values in columns.values():
+        values[unlogged] = np.nan
+    return analytics.History(np.arange(1, users + 1), None, columns)
+
+
+class Command(BaseCommand):
+    help = 'Time the vectorized analytics over synthetic users x days arrays (no database involved)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best wall time is kept')
+
+    def handle(self, *args, **options):
+        users, days = options['users'], options['days']
+        self.stdout.write(f'Generating {users} users x {days} days')
+        history = synthetic_history(users, days, options['seed'])
+        steps, sleep = history['steps'], history['sleep_seconds']
+        operations = {
+            'rolling_mean_7d': lambda: analytics.rolling_mean(steps, 7),
+            'week_over_week': lambda: analytics.week_over_week(steps),
+            'step_goal_streaks': lambda: analytics.streaks(steps >= analytics.STEP_GOAL),
+            'step_sleep_correlation': lambda: analytics.correlation(steps[:, :-1], sleep[:, 1:]),
+            'sleep_after_active_days': lambda: analytics.sleep_after_active_days(steps, sleep),
+            'insights': lambda: analytics.insights(history),
+        }
+        for name, operation in operations.items():
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                operation()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f'  {name:<28} {best:>8.3f}s {users / best:>12,.0f} users/s {users * days / best / 1e6:>8.1f}M days/s')
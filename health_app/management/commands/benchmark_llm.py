@@ -0,0 +1,129 @@
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from health_app import llm
+
+COMPLETION = json.dumps({
+    'id': 'chatcmpl-benchmark', 'object': 'chat.completion', 'created': 0, 'model': llm.MODEL,
+    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'Benchmark advice.'}, 'finish_reason': 'stop'}],
+}).encode()
+
+STARTUP = """
+import os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_advice.settings')
+started = time.perf_counter()
+import django
+django.setup()
+import health_app.views
+print(time.perf_counter() - started, 'openai' in sys.modules)
+"""
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests, as the real API does.
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; with Nagle's algorithm on, each reply waits out a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Answers every chat completion instantly and counts the TCP connections it accepted."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeOpenAIHandler)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1'
+
+
+@contextmanager
+def fake_openai_server():
+    """Run a FakeOpenAIServer and point the OpenAI backend at it for the block."""
+    server = FakeOpenAIServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with override_settings(
+            OPENAI_BASE_URL=server.base_url, OPENAI_API_KEY='benchmark', AI_LLM_BACKEND='health_app.llm.OpenAIBackend',
+        ):
+            yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class Command(BaseCommand):
+    help = 'Measure startup cost and per-call overhead of the LLM client against a local fake OpenAI server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=200, help='Calls per per-call measurement')
+        parser.add_argument('--repeat', type=int, default=3, help='Startup runs; the best time is kept')
+
+    def handle(self, *args, **options):
+        startups = [self.startup() for _ in range(options['repeat'])]
+        seconds, imports_openai = min(startups)
+        self.stdout.write(f"  {'startup (django.setup + views)':<36} {seconds * 1000:>8.1f} ms  openai imported: {imports_openai}")
+
+        calls = options['calls']
+        with fake_openai_server() as server:
+            started = time.perf_counter()
+            llm.get_backend().complete('Hello', 5)
+            self.report('first call (builds the client)', time.perf_counter() - started)
+
+            before = server.connections
+            started = time.perf_counter()
+            for _ in range(calls):
+                llm.get_backend().complete('Hello', 5)
+            self.report('pooled client, per call', (time.perf_counter() - started) / calls, server.connections - before)
+
+            before = server.connections
+            started = time.perf_counter()
+            asyncio.run(self.acalls(calls))
+            self.report('pooled async client, per call', (time.perf_counter() - started) / calls, server.connections - before)
+
+            before = server.connections
+            started = time.perf_counter()
+            for _ in range(calls):
+                backend = llm.OpenAIBackend()
+                backend.complete('Hello', 5)
+                backend.close()
+            self.report('new client per call', (time.perf_counter() - started) / calls, server.connections - before)
+        llm.reset_backend()
+
+    def startup(self):
+        output = subprocess.check_output([sys.executable, '-c', STARTUP], text=True).split()
+        return float(output[0]), output[1] == 'True'
+
+    async def acalls(self, calls):
+        for _ in range(calls):
+            await llm.get_backend().acomplete('Hello', 5)
+
+    def report(self, name, seconds, connections=None):
+        opened = '' if connections is None else f'  {connections} connections opened'
+        self.stdout.write(f'  {name:<36} {seconds * 1000:>8.2f} ms{opened}')
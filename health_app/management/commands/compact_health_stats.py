@@ -0,0 +1,21 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand
+from health_app.retention import compact, compaction_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Roll AppleHealthStat history older than the retention horizon into monthly totals and archive the raw rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, help='Days of raw history to keep (default: STATS_RETENTION_DAYS)')
+        parser.add_argument('--before', type=date.fromisoformat, help='Compact everything before this date (YYYY-MM-DD) instead')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users compacted per transaction')
+
+    def handle(self, *args, **options):
+        cutoff = options['before'] or compaction_cutoff(retention_days=options['retention_days'])
+        started = time.perf_counter()
+        archived, months = compact(cutoff, users_per_batch=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} rows before {cutoff} into {months} monthly totals in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from health_app.conditions import RULES
+from health_app.cohorts import persist_memberships
+
+
+class Command(BaseCommand):
+    help = 'Evaluate every cohort rule in one pass and persist the memberships the endpoints serve'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', help='Comma-separated rule names to evaluate (default: all registered rules)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Users evaluated per query')
+
+    def handle(self, *args, **options):
+        names = options['rules'].split(',') if options['rules'] else list(RULES)
+        unknown = [name for name in names if name not in RULES]
+        if unknown:
+            raise CommandError(f"Unknown rules: {', '.join(unknown)}")
+
+        started = time.perf_counter()
+        sizes = persist_memberships([RULES[name] for name in names], chunk_size=options['chunk_size'])
+        for name, size in sizes.items():
+            self.stdout.write(f'  {name:<20} {size:>8} members')
+        self.stdout.write(self.style.SUCCESS(f'Evaluated {len(sizes)} cohorts in {time.perf_counter() - started:.1f}s'))
@@ -1,56 +1,153 @@
-from collections import defaultdict
-import random
+import multiprocessing
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import numpy as np
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from health_app.models import AppleHealthStat
-from datetime import datetime, timedelta
+from django.db import connection, connections, transaction
 from django.utils import timezone
+from health_app.models import AppleHealthStat
+from health_app.queries import start_of_day
+from health_app.rollups import catch_up
+
+# Columns written for each generated row, in INSERT order.
+FIELDS = [
+    'user', 'created_at', 'updated_at', 'dateOfBirth', 'height', 'biologicalSex',
+    'bodyMass', 'bodyFatPercentage', 'activityMoveMode', 'stepCount', 'basalEnergyBurned',
+    'activeEnergyBurned', 'flightsClimbed', 'appleExerciseTime', 'appleMoveTime', 'appleStandHour',
+    'menstrualFlow', 'HKWorkoutTypeIdentifier', 'heartRate', 'oxygenSaturation',
+    'mindfulSession', 'sleepAnalysis', 'sleep_seconds',
+]
+
+
+def insert_sql():
+    opts = AppleHealthStat._meta
+    columns = [connection.ops.quote_name(opts.get_field(name).column) for name in FIELDS]
+    return 'INSERT INTO %s (%s) VALUES (%s)' % (
+        connection.ops.quote_name(opts.db_table), ', '.join(columns), ', '.join(['%s'] * len(columns))
+    )
+
+
+def generate_rows(user_ids, days, dropout, rng, today):
+    """Build AppleHealthStat rows (tuples in FIELDS order) with every column drawn as one NumPy array.
+
+    A ``dropout`` share of users stop syncing at a random day, so their most recent rows are missing.
+    """
+    ops = connection.ops
+    n_users = len(user_ids)
+    stopped = rng.random(n_users) < dropout
+    stop_day = np.where(stopped, rng.integers(1, days + 1, n_users), 0)
+
+    offsets = np.arange(days, -1, -1)
+    keep = offsets[None, :] >= stop_day[:, None]
+    user_index, day_index = np.nonzero(keep)
+    n = len(user_index)
+
+    # Profile fields are fixed per user; activity fields vary per day.
+    base_dob = timezone.make_aware(datetime(1980, 1, 1))
+    profile = {
+        'user': np.asarray(user_ids),
+        'dateOfBirth': np.array([
+            ops.adapt_datetimefield_value(base_dob + timedelta(days=int(day)))
+            for day in rng.integers(0, 365 * 40, n_users)
+        ], dtype=object),
+        'height': rng.integers(150, 201, n_users),
+        'biologicalSex': rng.choice(['male', 'female'], n_users),
+    }
+    dates = [today - timedelta(days=int(offset)) for offset in offsets]
+    created = np.array([ops.adapt_datetimefield_value(start_of_day(day)) for day in dates], dtype=object)
+    sleep_time = rng.random(n) * 24 * 3600
+    sessions = rng.integers(0, 61, (n, 7)).tolist()
+
+    columns = {
+        **{name: values[user_index] for name, values in profile.items()},
+        'created_at': created[day_index],
+        'updated_at': np.full(n, ops.adapt_datetimefield_value(timezone.now()), dtype=object),
+        'bodyMass': rng.integers(50, 101, n),
+        'bodyFatPercentage': rng.integers(10, 31, n),
+        'activityMoveMode': rng.choice(['activeEnergy', 'sedentary'], n),
+        'stepCount': rng.integers(0, 20000, n),
+        'basalEnergyBurned': rng.integers(1000, 3001, n),
+        'activeEnergyBurned': rng.integers(100, 1001, n),
+        'flightsClimbed': rng.integers(0, 21, n),
+        'appleExerciseTime': rng.integers(0, 121, n),
+        'appleMoveTime': rng.integers(0, 121, n),
+        'appleStandHour': rng.integers(0, 25, n),
+        'menstrualFlow': rng.choice(['unspecified', 'light', 'medium', 'heavy'], n),
+        'HKWorkoutTypeIdentifier': rng.choice(['running', 'walking', 'cycling'], n),
+        'heartRate': rng.integers(60, 101, n),
+        'oxygenSaturation': rng.integers(95, 101, n),
+        'mindfulSession': [ops.adapt_json_value({"sessions": s}, None) for s in sessions],
+        'sleepAnalysis': [
+            ops.adapt_json_value([{"date": dates[d].isoformat(), "sleep_time": t}], None)
+            for d, t in zip(day_index.tolist(), sleep_time.tolist())
+        ],
+        # The rows bypass save(), so the denormalized sleep total is filled in here.
+        'sleep_seconds': sleep_time.astype(np.int64),
+    }
+    return list(zip(*(
+        values.tolist() if isinstance(values, np.ndarray) else values
+        for values in (columns[name] for name in FIELDS)
+    )))
+
+
+# Held around each write; pool workers on SQLite share a lock so only one writes at a time.
+write_lock = nullcontext()
+
+
+def init_worker(lock):
+    global write_lock
+    write_lock = lock
+
+
+def generate_chunk(task):
+    index, user_ids, options, today = task
+    rng = np.random.default_rng([options['seed'], index])
+    rows = generate_rows(user_ids, options['days'], options['dropout'], rng, today)
+    with write_lock, transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(insert_sql(), rows)
+    return len(rows)
 
 
 class Command(BaseCommand):
     help = 'Generate random data for AppleHealthStat'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, help='Only generate data for the first N users')
+        parser.add_argument('--days', type=int, default=360, help='Days of history per user, ending today')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible datasets')
+        parser.add_argument('--dropout', type=float, default=0.5, help='Share of users who stop syncing at a random day')
+        parser.add_argument('--batch-size', type=int, default=20000, help='Rows generated and written per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes generating chunks in parallel')
+
+    def handle(self, *args, **options):
         User = get_user_model()
-        users = User.objects.all()
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True)[:options['users']])
         today = timezone.now().date()
 
-        for user in users:
-            # did he stop?
-            num = random.randint(0, 10)
-            stopped = False
-            if num < 5: # stopped after some days.
-                stopped = True
-            stop_day = 0
-            if stopped: # when did he stop?
-                stop_day = random.randint(1, 360)
-
-            for i in range(360, -1, -1):  # Generate data for the last 360 days
-                if i < stop_day: continue
-                stat = AppleHealthStat(
-                    user=user,
-                    created_at=today - timedelta(days=i),
-                    dateOfBirth=datetime(1980, 1, 1) + timedelta(days=random.randint(0, 365 * 40)),
-                    height=random.randint(150, 200),
-                    bodyMass=random.randint(50, 100),
-                    bodyFatPercentage=random.randint(10, 30),
-                    biologicalSex=random.choice(['male', 'female']),
-                    activityMoveMode=random.choice(['activeEnergy', 'sedentary']),
-                    stepCount=random.uniform(0, 20000),
-                    basalEnergyBurned=random.randint(1000, 3000),
-                    activeEnergyBurned=random.randint(100, 1000),
-                    flightsClimbed=random.randint(0, 20),
-                    appleExerciseTime=random.randint(0, 120),
-                    appleMoveTime=random.randint(0, 120),
-                    appleStandHour=random.randint(0, 24),
-                    menstrualFlow=random.choice(['unspecified', 'light', 'medium', 'heavy']),
-                    HKWorkoutTypeIdentifier=random.choice(['running', 'walking', 'cycling']),
-                    heartRate=random.randint(60, 100),
-                    oxygenSaturation=random.randint(95, 100),
-                    mindfulSession={"sessions": [random.randint(0, 60) for _ in range(7)]},
-                    sleepAnalysis=[{"date": (today - timedelta(days=i)).isoformat(), "sleep_time": random.uniform(0, 24) * 3600}]
-                    # sleepAnalysis=[{"date": (datetime.now() - timedelta(days=i)).isoformat(), "sleep_time": random.uniform(0, 1) * 3600} for i in range(12)],
-                )
-                stat.save()
-
-        self.stdout.write(self.style.SUCCESS('Successfully generated random data'))
+        users_per_task = max(1, options['batch_size'] // (options['days'] + 1))
+        tasks = [
+            (index, user_ids[start:start + users_per_task], options, today)
+            for index, start in enumerate(range(0, len(user_ids), users_per_task))
+        ]
+
+        started = time.perf_counter()
+        if options['workers'] > 1:
+            context = multiprocessing.get_context('fork')
+            # SQLite allows a single writer, so workers generate in parallel but take turns writing.
+            lock = context.Lock() if connection.vendor == 'sqlite' else nullcontext()
+            # Forked workers must open their own database connections.
+            connections.close_all()
+            with context.Pool(options['workers'], initializer=init_worker, initargs=(lock,)) as pool:
+                total = sum(pool.imap_unordered(generate_chunk, tasks))
+        else:
+            total = sum(map(generate_chunk, tasks))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully generated random data: {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
+
+        # The rows bypass save(), so the daily rollup is brought up to date in one pass.
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {catch_up()} daily rollups'))
@@ -1,20 +1,33 @@
-import random
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
 
 class Command(BaseCommand):
     help = 'Generate random users for testing'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100, help='Number of users to create')
+        parser.add_argument('--start', type=int, default=0, help='Index of the first user (usernames are user<index>)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Users per INSERT')
+        parser.add_argument('--fast-hash', action='store_true', help='Hash the shared test password once and reuse it for every user')
+
+    def handle(self, *args, **options):
         User = get_user_model()
+        password = 'password123'  # password for testing
+        shared_hash = make_password(password) if options['fast_hash'] else None
 
-        num_users = 100 # This number to create more or fewer users
-        for i in range(num_users):  
+        users = []
+        for i in range(options['start'], options['start'] + options['count']):
             username = f'user{i}'
-            email = f'{username}@example.com'
-            password = 'password123'  # password for testing
+            users.append(User(
+                username=username,
+                email=f'{username}@example.com',
+                password=shared_hash or make_password(password),
+            ))
 
-            user = User.objects.create_user(username=username, email=email, password=password)
-            user.save()
+        # Existing usernames are skipped, so the command can be re-run to extend a dataset.
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=options['batch_size'], ignore_conflicts=True)
 
-        self.stdout.write(self.style.SUCCESS('Successfully generated random users'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('Successfully generated random users'))
@@ -0,0 +1,86 @@
+import asyncio
+import statistics
+import time
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from health_app.management.commands.benchmark import throwaway_database
+
+
+class Command(BaseCommand):
+    help = 'Compare one sync worker with one async worker serving concurrent advice requests, with a stubbed LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=40, help='Requests sent to each endpoint')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once against the async worker')
+        parser.add_argument('--cohort', type=int, default=8, help='Users in the cohort, i.e. LLM calls per request')
+        parser.add_argument('--latency', type=float, default=0.2, help='Seconds the stubbed LLM takes per call')
+
+    def handle(self, *args, **options):
+        latency = options['latency']
+
+        def stub(prompt, timeout):
+            time.sleep(latency)
+            return 'Load test advice.'
+
+        async def astub(prompt, timeout):
+            await asyncio.sleep(latency)
+            return 'Load test advice.'
+
+        # Every request must reach the LLM, so advice is not cached.
+        caches = {**settings.CACHES, 'ai_responses': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with throwaway_database(), override_settings(CACHES=caches, ALLOWED_HOSTS=hosts), \
+                mock.patch('health_app.utils.chat_completion', stub), mock.patch('health_app.utils.achat_completion', astub):
+            # Users who never synced all fall in the sleep cohort.
+            User = get_user_model()
+            User.objects.bulk_create([User(username=f'load{i}') for i in range(options['cohort'])])
+
+            results = {
+                'sync': self.run_sync(reverse('sleep-condition'), options['requests']),
+                'async': asyncio.run(self.run_async(reverse('async-sleep-condition'), options['requests'], options['concurrency'])),
+            }
+
+        for name, (elapsed, latencies) in results.items():
+            latencies.sort()
+            self.stdout.write(
+                f"  {name:<6} {len(latencies) / elapsed:>8.1f} req/s  p50 {statistics.median(latencies):.3f}s  "
+                f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.3f}s  total {elapsed:.2f}s"
+            )
+        speedup = results['sync'][0] / results['async'][0]
+        self.stdout.write(self.style.SUCCESS(f'One async worker served the load {speedup:.1f}x faster than one sync worker'))
+
+    def expect_ok(self, response):
+        if response.status_code != 200:
+            raise CommandError(f'Request failed with status {response.status_code}')
+
+    def run_sync(self, url, requests):
+        # A WSGI worker handles one request at a time.
+        client = Client()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            sent = time.perf_counter()
+            self.expect_ok(client.get(url))
+            latencies.append(time.perf_counter() - sent)
+        return time.perf_counter() - started, latencies
+
+    async def run_async(self, url, requests, concurrency):
+        # An ASGI worker interleaves every request in flight on one event loop.
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def send():
+            async with slots:
+                sent = time.perf_counter()
+                self.expect_ok(await client.get(url))
+                latencies.append(time.perf_counter() - sent)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send() for _ in range(requests)))
+        return time.perf_counter() - started, latencies
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from health_app.conditions import CONDITIONS
+from health_app.snapshots import refresh
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the advice snapshots of members whose data or cohort membership changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', help='Comma-separated conditions to refresh (default: all conditions)')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Users summarized and advised per batch (default: AI_JOB_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        names = options['rules'].split(',') if options['rules'] else list(CONDITIONS)
+        unknown = [name for name in names if name not in CONDITIONS]
+        if unknown:
+            raise CommandError(f"Unknown conditions: {', '.join(unknown)}")
+
+        started = time.perf_counter()
+        for name in names:
+            members, regenerated, removed = refresh(CONDITIONS[name], chunk_size=options['chunk_size'])
+            self.stdout.write(f'  {name:<20} {members:>8} members {regenerated:>8} regenerated {removed:>8} removed')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {len(names)} conditions in {time.perf_counter() - started:.1f}s'))
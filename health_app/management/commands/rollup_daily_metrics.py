@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from health_app.rollups import catch_up
+
+
+class Command(BaseCommand):
+    help = 'Bring the DailyUserMetrics rollup up to date with AppleHealthStat'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every day instead of only rows changed since the last run')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = catch_up(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully refreshed {total} daily rollups in {time.perf_counter() - started:.1f}s'
+        ))
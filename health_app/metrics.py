@@ -0,0 +1,264 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as Tally
+from contextvars import ContextVar
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Metric:
+    """Process-wide metric with optional labels, rendered in Prometheus text format."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            lines.extend(f'{name}{_format_labels(labels)} {value}' for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing counter."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @property
+    def value(self):
+        return self._values.get((), 0)
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if not self.labelnames and not self._values:
+            yield self.name, (), 0
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+
+# Seconds; Prometheus' default buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts plus the sum and count of observed values."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = counts, total + value
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels)) or ([0], 0)
+        return sum(counts)
+
+    def samples(self):
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', (*key, ('le', bound)), cumulative
+            yield f'{self.name}_sum', key, total
+            yield f'{self.name}_count', key, cumulative
+
+
+REGISTRY = []
+
+
+def counter(name, documentation, labelnames=()):
+    metric = Counter(name, documentation, labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, documentation, labelnames, buckets)
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+ai_cache_hits = counter('health_advice_ai_cache_hits_total', 'Advice served from the AI response cache.')
+ai_cache_misses = counter('health_advice_ai_cache_misses_total', 'Advice that had to be generated by the LLM.')
+ai_template_responses = counter(
+    'health_advice_ai_template_responses_total',
+    'Advice written from a template instead of the LLM, by reason: disabled for the rule, budget, breaker or error.',
+    ['reason'],
+)
+
+requests_total = counter(
+    'health_advice_http_requests_total', 'HTTP requests handled.', ['endpoint', 'method', 'status'],
+)
+request_seconds = histogram(
+    'health_advice_http_request_duration_seconds', 'Time to handle a request, streamed bodies included.',
+    ['endpoint', 'method'],
+)
+request_queries = histogram(
+    'health_advice_db_queries_per_request', 'Database queries run by one request.', ['endpoint'],
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+db_queries = counter('health_advice_db_queries_total', 'Database queries run while handling requests.', ['endpoint'])
+db_query_seconds = counter(
+    'health_advice_db_query_seconds_total', 'Time spent in database queries while handling requests.', ['endpoint'],
+)
+db_duplicate_queries = counter(
+    'health_advice_db_duplicate_queries_total',
+    'Queries repeating a statement already run by the same request; a steady rise signals an N+1 loop.',
+    ['endpoint'],
+)
+llm_calls = counter('health_advice_llm_calls_total', 'LLM completion attempts, retries included.', ['outcome'])
+llm_call_seconds = histogram(
+    'health_advice_llm_call_duration_seconds', 'Latency of one LLM completion attempt.',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+
+
+class RequestStats:
+    """Database and LLM work done on behalf of one request.
+
+    As a database execute wrapper it times every query and tallies statements by their SQL.
+    Parameters are bound separately, so the same statement run once per row of an outer loop shows
+    up as one SQL string with a high count.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements = Tally()
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+            self.statements[sql] += 1
+
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def most_repeated(self):
+        """``(sql, count)`` for the statement run most often, or None."""
+        return next(iter(self.statements.most_common(1)), None)
+
+    def add_llm_call(self, seconds):
+        # LLM calls run on worker threads, so unlike queries these can arrive concurrently.
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+
+
+# A context variable rather than a thread-local, so it follows async requests across awaits and
+# into the threads asgiref runs their ORM calls on.
+_current_request = ContextVar('current_request', default=None)
+
+
+def current_request():
+    """The RequestStats of the request being handled in this context, if any."""
+    return _current_request.get()
+
+
+def set_current_request(stats):
+    _current_request.set(stats)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every database connection; charges queries to the current request."""
+    stats = current_request()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def _record_llm_call(stats, outcome, elapsed):
+    llm_calls.inc(outcome=outcome)
+    llm_call_seconds.observe(elapsed)
+    if stats is not None:
+        stats.add_llm_call(elapsed)
+
+
+def timed_completion(complete):
+    """Wrap an LLM ``complete(prompt, timeout)`` callable so each attempt is counted and timed.
+
+    The current request is captured here, on the request's thread, because the wrapper itself is
+    called from the worker pool.
+    """
+    stats = current_request()
+
+    def call(prompt, timeout):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = complete(prompt, timeout)
+            outcome = 'ok'
+            return response
+        finally:
+            _record_llm_call(stats, outcome, time.perf_counter() - started)
+
+    return call
+
+
+def timed_acompletion(complete):
+    """timed_completion() for an async ``complete(prompt, timeout)``."""
+    stats = current_request()
+
+    async def call(prompt, timeout):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await complete(prompt, timeout)
+            outcome = 'ok'
+            return response
+        finally:
+            _record_llm_call(stats, outcome, time.perf_counter() - started)
+
+    return call
@@ -0,0 +1,110 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """Record latency, database work and LLM calls per endpoint.
+
+    Endpoints are labelled by their URL route (``api/cohorts/<str:rule>/``), so the metric series
+    stay bounded however many users or rules there are. Queries are charged to the request through
+    the execute wrapper every connection gets (see health_app.signals). Streamed bodies are produced
+    after the view returns; their work is counted as they are sent and the request is recorded once
+    the stream is exhausted or closed. With ``DEBUG`` on, the counts so far are also returned in
+    response headers.
+
+    Works in both sync and async stacks, so async views are not pushed onto a thread by it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, started = metrics.RequestStats(), time.perf_counter()
+        previous = metrics.current_request()
+        metrics.set_current_request(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.set_current_request(previous)
+        return self.process_response(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, started = metrics.RequestStats(), time.perf_counter()
+        previous = metrics.current_request()
+        metrics.set_current_request(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.set_current_request(previous)
+        return self.process_response(request, response, stats, started)
+
+    def process_response(self, request, response, stats, started):
+        def finish():
+            self.record(request, response, stats, time.perf_counter() - started)
+
+        if not response.streaming:
+            finish()
+        elif response.is_async:
+            response.streaming_content = self.astream(response.streaming_content, stats, finish)
+        else:
+            response.streaming_content = self.stream(response.streaming_content, stats, finish)
+        if settings.DEBUG:
+            self.add_headers(response, stats, time.perf_counter() - started)
+        return response
+
+    def stream(self, content, stats, finish):
+        previous = metrics.current_request()
+        metrics.set_current_request(stats)
+        try:
+            yield from content
+        finally:
+            metrics.set_current_request(previous)
+            finish()
+
+    async def astream(self, content, stats, finish):
+        previous = metrics.current_request()
+        metrics.set_current_request(stats)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            metrics.set_current_request(previous)
+            finish()
+
+    def record(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        endpoint = match.route if match else 'unmatched'
+        metrics.requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        metrics.request_seconds.observe(elapsed, endpoint=endpoint, method=request.method)
+        metrics.request_queries.observe(stats.queries, endpoint=endpoint)
+        metrics.db_queries.inc(stats.queries, endpoint=endpoint)
+        metrics.db_query_seconds.inc(stats.query_seconds, endpoint=endpoint)
+        metrics.db_duplicate_queries.inc(stats.duplicate_queries, endpoint=endpoint)
+
+        repeated = stats.most_repeated()
+        if repeated and repeated[1] >= settings.DUPLICATE_QUERY_WARNING:
+            logger.warning('%s %s ran the same query %d times: %s', request.method, endpoint, repeated[1], repeated[0])
+
+    def add_headers(self, response, stats, elapsed):
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.query_seconds * 1000:.1f}',
+            f'llm;dur={stats.llm_seconds * 1000:.1f}',
+            f'total;dur={elapsed * 1000:.1f}',
+        ])
+        response['X-DB-Queries'] = stats.queries
+        response['X-DB-Duplicate-Queries'] = stats.duplicate_queries
+        response['X-LLM-Calls'] = stats.llm_calls
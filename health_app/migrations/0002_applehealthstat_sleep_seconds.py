@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+def backfill_sleep_seconds(apps, schema_editor):
+    AppleHealthStat = apps.get_model('health_app', 'AppleHealthStat')
+    batch = []
+    for stat in AppleHealthStat.objects.only('id', 'sleepAnalysis').iterator(chunk_size=2000):
+        stat.sleep_seconds = int(sum(entry.get('sleep_time') or 0 for entry in stat.sleepAnalysis or []))
+        batch.append(stat)
+        if len(batch) >= 2000:
+            AppleHealthStat.objects.bulk_update(batch, ['sleep_seconds'])
+            batch = []
+    if batch:
+        AppleHealthStat.objects.bulk_update(batch, ['sleep_seconds'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='applehealthstat',
+            name='sleep_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='applehealthstat',
+            name='created_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.RunPython(backfill_sleep_seconds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_app', '0002_applehealthstat_sleep_seconds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='applehealthstat',
+            index=models.Index(fields=['user', '-created_at'], name='stat_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='applehealthstat',
+            index=models.Index(fields=['created_at', 'stepCount'], name='stat_created_steps_idx'),
+        ),
+    ]
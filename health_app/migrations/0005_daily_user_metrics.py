@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_app', '0004_advice_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('steps', models.PositiveIntegerField(default=0)),
+                ('sleep_seconds', models.PositiveIntegerField(default=0)),
+                ('active_energy', models.PositiveIntegerField(default=0)),
+                ('basal_energy', models.PositiveIntegerField(default=0)),
+                ('heart_rate', models.FloatField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'steps'], name='daily_metrics_date_steps_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='daily_metrics_user_date_uniq')],
+            },
+        ),
+    ]
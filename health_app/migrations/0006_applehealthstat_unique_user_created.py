@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_stats(apps, schema_editor):
+    # Keep the most recently written row for each (user, created_at) before the constraint is added.
+    AppleHealthStat = apps.get_model('health_app', 'AppleHealthStat')
+    duplicates = (
+        AppleHealthStat.objects.values('user_id', 'created_at')
+        .annotate(rows=Count('id'), keep=Max('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates.iterator():
+        AppleHealthStat.objects.filter(
+            user_id=duplicate['user_id'], created_at=duplicate['created_at']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_app', '0005_daily_user_metrics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_stats, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='applehealthstat',
+            name='stat_user_created_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='applehealthstat',
+            constraint=models.UniqueConstraint(fields=('user', 'created_at'), name='stat_user_created_uniq'),
+        ),
+    ]
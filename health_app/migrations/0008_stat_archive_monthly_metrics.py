@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_app', '0007_cohort_memberships'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppleHealthStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dateOfBirth', models.DateTimeField(blank=True, null=True)),
+                ('height', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('bodyMass', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('bodyFatPercentage', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('biologicalSex', models.CharField(blank=True, max_length=32, null=True)),
+                ('activityMoveMode', models.CharField(blank=True, max_length=128, null=True)),
+                ('stepCount', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('basalEnergyBurned', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('activeEnergyBurned', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('flightsClimbed', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('appleExerciseTime', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('appleMoveTime', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('appleStandHour', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('menstrualFlow', models.CharField(blank=True, max_length=128, null=True)),
+                ('HKWorkoutTypeIdentifier', models.CharField(blank=True, max_length=128, null=True)),
+                ('heartRate', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('oxygenSaturation', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('mindfulSession', models.JSONField(blank=True, null=True)),
+                ('sleepAnalysis', models.JSONField(blank=True, null=True)),
+                ('sleep_seconds', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='archived_stat_user_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyUserMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('steps', models.PositiveBigIntegerField(default=0)),
+                ('sleep_seconds', models.PositiveBigIntegerField(default=0)),
+                ('active_energy', models.PositiveBigIntegerField(default=0)),
+                ('basal_energy', models.PositiveBigIntegerField(default=0)),
+                ('days_logged', models.PositiveSmallIntegerField(default=0)),
+                ('perfect_sleep_nights', models.PositiveSmallIntegerField(default=0)),
+                ('last_date', models.DateField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_metrics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'month'), name='monthly_metrics_user_month_uniq')],
+            },
+        ),
+    ]
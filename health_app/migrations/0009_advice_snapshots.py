@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_app', '0008_stat_archive_monthly_metrics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdviceRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule', models.CharField(max_length=32, unique=True)),
+                ('refreshed_at', models.DateTimeField()),
+                ('members', models.PositiveIntegerField(default=0)),
+                ('regenerated', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AdviceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule', models.CharField(max_length=32)),
+                ('ai_response', models.TextField()),
+                ('fingerprint', models.CharField(max_length=80)),
+                ('generated_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='advice_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('rule', 'user'), name='advice_snapshot_rule_user_uniq')],
+            },
+        ),
+    ]
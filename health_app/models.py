@@ -1,9 +1,19 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
-class AppleHealthStat(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='apple_health_stat')
+
+
+def total_sleep_seconds(sleep_analysis):
+    # sleepAnalysis is a list of {"date": ..., "sleep_time": seconds} entries
+    if not sleep_analysis:
+        return 0
+    return int(sum(entry.get('sleep_time') or 0 for entry in sleep_analysis))
+
+
+class HealthStatFields(models.Model):
+    """Columns shared by the live AppleHealthStat table and its archive."""
     dateOfBirth = models.DateTimeField(null=True, blank=True)
     height = models.PositiveSmallIntegerField(null=True, blank=True)
     bodyMass = models.PositiveSmallIntegerField(null=True, blank=True)
@@ -23,5 +33,169 @@ class AppleHealthStat(models.Model):
     oxygenSaturation = models.PositiveSmallIntegerField(null=True, blank=True)
     mindfulSession = models.JSONField(null=True, blank=True)
     sleepAnalysis = models.JSONField(null=True, blank=True)
+    # Denormalized total of sleepAnalysis[*].sleep_time so aggregations never decode the JSON.
+    sleep_seconds = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class AppleHealthStat(HealthStatFields):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='apple_health_stat')
+
+    class Meta:
+        # One row per user per timestamp; ingestion upserts on it. The index also serves newest-first lookups.
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'created_at'], name='stat_user_created_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at', 'stepCount'], name='stat_created_steps_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.sleep_seconds = total_sleep_seconds(self.sleepAnalysis)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'sleepAnalysis' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'sleep_seconds'}
+        super().save(*args, **kwargs)
+
+
+class ArchivedAppleHealthStat(HealthStatFields):
+    """AppleHealthStat rows older than the retention horizon, moved here by health_app.retention.
+
+    Nothing reads this table on a request path; lifetime totals come from MonthlyUserMetrics.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_stats')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='archived_stat_user_created_idx'),
+        ]
+
+
+class AdviceJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    condition = models.CharField(max_length=32)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class AdviceResult(models.Model):
+    job = models.ForeignKey(AdviceJob, on_delete=models.CASCADE, related_name='results')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='advice_results')
+    ai_response = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'user'], name='advice_result_job_user_uniq'),
+        ]
+
+
+class DailyUserMetrics(models.Model):
+    """Per-user daily rollup of AppleHealthStat, kept current by health_app.rollups."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_metrics')
+    date = models.DateField()
+    steps = models.PositiveIntegerField(default=0)
+    sleep_seconds = models.PositiveIntegerField(default=0)
+    active_energy = models.PositiveIntegerField(default=0)
+    basal_energy = models.PositiveIntegerField(default=0)
+    heart_rate = models.FloatField(null=True, blank=True)  # daily mean
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='daily_metrics_user_date_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'steps'], name='daily_metrics_date_steps_idx'),
+        ]
+
+
+class RollupRun(models.Model):
+    """A completed health_app.rollups.catch_up run; the latest one's start time is the next run's watermark."""
+    started_at = models.DateTimeField(db_index=True)
+    rows = models.PositiveIntegerField(default=0)
+
+
+# A night of at least this much sleep counts as perfect in the lifetime totals.
+PERFECT_SLEEP_SECONDS = 8 * 3600
+
+
+class MonthlyUserMetrics(models.Model):
+    """Per-user monthly totals of DailyUserMetrics rows compacted away by health_app.retention."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_metrics')
+    month = models.DateField()  # first day of the month
+    steps = models.PositiveBigIntegerField(default=0)
+    sleep_seconds = models.PositiveBigIntegerField(default=0)
+    active_energy = models.PositiveBigIntegerField(default=0)
+    basal_energy = models.PositiveBigIntegerField(default=0)
+    days_logged = models.PositiveSmallIntegerField(default=0)
+    perfect_sleep_nights = models.PositiveSmallIntegerField(default=0)
+    last_date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='monthly_metrics_user_month_uniq'),
+        ]
+
+
+class CohortEvaluation(models.Model):
+    """When each cohort rule was last evaluated in batch by health_app.cohorts.persist_memberships."""
+    rule = models.CharField(max_length=32, unique=True)
+    evaluated_on = models.DateField()
+    evaluated_at = models.DateTimeField()
+    members = models.PositiveIntegerField(default=0)
+
+
+class CohortMembership(models.Model):
+    """A user's membership in a cohort rule, with the rule's term values at evaluation time."""
+    rule = models.CharField(max_length=32)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cohort_memberships')
+    values = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['rule', 'user'], name='cohort_membership_rule_user_uniq'),
+        ]
+
+
+class AdviceSnapshot(models.Model):
+    """The latest advice for a condition's member, kept by health_app.snapshots.refresh.
+
+    ``fingerprint`` is the advice cache key of the summary the advice was generated from, so a refresh
+    can tell whose data changed without calling the LLM.
+    """
+    rule = models.CharField(max_length=32)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='advice_snapshots')
+    ai_response = models.TextField()
+    fingerprint = models.CharField(max_length=80)
+    generated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['rule', 'user'], name='advice_snapshot_rule_user_uniq'),
+        ]
+
+
+class AdviceRefresh(models.Model):
+    """When each condition's advice snapshots were last brought up to date."""
+    rule = models.CharField(max_length=32, unique=True)
+    refreshed_at = models.DateTimeField()
+    members = models.PositiveIntegerField(default=0)
+    regenerated = models.PositiveIntegerField(default=0)
@@ -0,0 +1,36 @@
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# orjson writes datetimes, dates, UUIDs and dict/list subclasses (DRF's ReturnDict/ReturnList) natively
+# and in C. Anything else (Decimal, timedelta, lazy translations) goes through DRF's own encoder, so the
+# output matches JSONRenderer's.
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+_fallback = JSONEncoder().default
+
+
+def dumps(data, option=0):
+    return orjson.dumps(data, default=_fallback, option=OPTIONS | option)
+
+
+def ndjson_line(entry):
+    return dumps(entry, orjson.OPT_APPEND_NEWLINE)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """Drop-in replacement for DRF's JSONRenderer, several times faster on large cohort responses.
+
+    ``Accept: application/json; indent=N`` pretty-prints, with orjson's fixed two-space indent.
+    """
+
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        option = 0
+        if accepted_media_type and 'indent=' in accepted_media_type:
+            option = orjson.OPT_INDENT_2
+        return dumps(data, option)
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from health_app.models import (
+    PERFECT_SLEEP_SECONDS, AppleHealthStat, ArchivedAppleHealthStat, DailyUserMetrics, MonthlyUserMetrics,
+)
+from health_app.queries import start_of_day
+from health_app.rollups import catch_up
+
+MONTHLY_FIELDS = ['steps', 'sleep_seconds', 'active_energy', 'basal_energy', 'days_logged', 'perfect_sleep_nights']
+
+
+def compaction_cutoff(today=None, retention_days=None):
+    """First day of the month containing the retention horizon; only whole months before it are compacted."""
+    today = today or timezone.localdate()
+    retention_days = settings.STATS_RETENTION_DAYS if retention_days is None else retention_days
+    return (today - timedelta(days=retention_days)).replace(day=1)
+
+
+def _move_sql():
+    # Column lists come from the shared model fields, so the two tables cannot drift apart.
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in AppleHealthStat._meta.concrete_fields if not field.primary_key)
+    hot, archive = quote(AppleHealthStat._meta.db_table), quote(ArchivedAppleHealthStat._meta.db_table)
+    where = f'{quote("user_id")} > %s AND {quote("user_id")} <= %s AND {quote("created_at")} < %s'
+    return (
+        f'INSERT INTO {archive} ({columns}) SELECT {columns} FROM {hot} WHERE {where}',
+        f'DELETE FROM {hot} WHERE {where}',
+    )
+
+
+def _compact_users(first_id, last_id, cutoff):
+    """Compact one range of users (first_id, last_id]; returns (stats archived, months touched)."""
+    users = Q(user_id__gt=first_id, user_id__lte=last_id)
+    # Totals are aliased apart from the rollup columns they are computed from.
+    months = DailyUserMetrics.objects.filter(users, date__lt=cutoff).annotate(
+        month=TruncMonth('date'),
+    ).values('user_id', 'month').annotate(
+        total_steps=Sum('steps'),
+        total_sleep_seconds=Sum('sleep_seconds'),
+        total_active_energy=Sum('active_energy'),
+        total_basal_energy=Sum('basal_energy'),
+        total_days_logged=Count('id'),
+        total_perfect_sleep_nights=Count('id', filter=Q(sleep_seconds__gte=PERFECT_SLEEP_SECONDS)),
+        last_date=Max('date'),
+    ).order_by()
+
+    # Late rows for an already compacted month are added to its totals.
+    existing = {
+        (row.user_id, row.month): row
+        for row in MonthlyUserMetrics.objects.filter(users, month__lt=cutoff)
+    }
+    rows = []
+    for totals in months:
+        row = MonthlyUserMetrics(user_id=totals['user_id'], month=totals['month'], last_date=totals['last_date'])
+        previous = existing.get((row.user_id, row.month))
+        for field in MONTHLY_FIELDS:
+            setattr(row, field, totals[f'total_{field}'] + (getattr(previous, field) if previous else 0))
+        if previous:
+            row.last_date = max(row.last_date, previous.last_date)
+        rows.append(row)
+    MonthlyUserMetrics.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['user', 'month'], update_fields=[*MONTHLY_FIELDS, 'last_date'],
+    )
+
+    # Raw statements: moving rows must not fire the per-row rollup signals.
+    insert_sql, delete_sql = _move_sql()
+    params = [first_id, last_id, connection.ops.adapt_datetimefield_value(start_of_day(cutoff))]
+    with connection.cursor() as cursor:
+        cursor.execute(insert_sql, params)
+        cursor.execute(delete_sql, params)
+        archived = cursor.rowcount
+    DailyUserMetrics.objects.filter(users, date__lt=cutoff).delete()
+    return archived, len(rows)
+
+
+def compact(cutoff=None, users_per_batch=1000):
+    """Roll history before ``cutoff`` into MonthlyUserMetrics and move its raw stats to the archive.
+
+    Runs in one transaction per batch of users, so an interrupted run leaves every user either fully
+    compacted or untouched and can simply be repeated. Returns (stats archived, months written).
+    """
+    cutoff = cutoff or compaction_cutoff()
+    # The monthly totals are built from the daily rollup, so it must cover every row being moved.
+    catch_up()
+
+    user_ids = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+    archived = months = 0
+    last_id = 0
+    while True:
+        batch = list(user_ids.filter(pk__gt=last_id)[:users_per_batch])
+        if not batch:
+            return archived, months
+        with transaction.atomic():
+            moved, touched = _compact_users(last_id, batch[-1], cutoff)
+        archived += moved
+        months += touched
+        last_id = batch[-1]
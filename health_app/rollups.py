@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.db.models import Avg, Max, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from health_app.models import AppleHealthStat, DailyUserMetrics, RollupRun
+from health_app.queries import start_of_day
+
+METRIC_FIELDS = ['steps', 'sleep_seconds', 'active_energy', 'basal_energy', 'heart_rate', 'refreshed_at']
+
+
+def day_range(day):
+    return AppleHealthStat.objects.filter(
+        created_at__gte=start_of_day(day),
+        created_at__lt=start_of_day(day + timedelta(days=1)),
+    )
+
+
+def rollup_rows(stats, refreshed_at, batch_size=1000):
+    """Aggregate ``stats`` per (user, day) and upsert the totals into DailyUserMetrics."""
+    totals = stats.annotate(day=TruncDate('created_at')).values('user_id', 'day').annotate(
+        steps=Coalesce(Sum('stepCount'), 0),
+        sleep=Coalesce(Sum('sleep_seconds'), 0),
+        active=Coalesce(Sum('activeEnergyBurned'), 0),
+        basal=Coalesce(Sum('basalEnergyBurned'), 0),
+        heart_rate=Avg('heartRate'),
+    ).order_by()
+    rows = [
+        DailyUserMetrics(
+            user_id=row['user_id'], date=row['day'], steps=row['steps'], sleep_seconds=row['sleep'],
+            active_energy=row['active'], basal_energy=row['basal'], heart_rate=row['heart_rate'],
+            refreshed_at=refreshed_at,
+        )
+        for row in totals
+    ]
+    DailyUserMetrics.objects.bulk_create(
+        rows, batch_size=batch_size, update_conflicts=True,
+        unique_fields=['user', 'date'], update_fields=METRIC_FIELDS,
+    )
+    return len(rows)
+
+
+def refresh_daily_metrics(user_id, day):
+    """Recompute one user's rollup for one day, dropping it if the day no longer has any stats."""
+    stats = day_range(day).filter(user_id=user_id)
+    if not rollup_rows(stats, timezone.now()):
+        DailyUserMetrics.objects.filter(user_id=user_id, date=day).delete()
+
+
+def catch_up(full=False):
+    """Bring the rollup up to date with stats written outside save(), e.g. by bulk loads.
+
+    Only (user, day) pairs whose stats changed since the previous run are recomputed. The
+    watermark is the start time of the last completed run, kept in RollupRun. It cannot come from
+    DailyUserMetrics.refreshed_at: save() stamps that with the current time, which would skip bulk
+    rows written before it that no run has rolled up yet.
+    """
+    started = timezone.now()
+    watermark = None if full else RollupRun.objects.aggregate(Max('started_at'))['started_at__max']
+    changed = AppleHealthStat.objects.all()
+    if watermark is not None:
+        changed = changed.filter(updated_at__gte=watermark)
+
+    days = changed.annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct().order_by()
+    total = 0
+    for day in days:
+        stats = day_range(day)
+        if watermark is not None:
+            stats = stats.filter(user_id__in=day_range(day).filter(updated_at__gte=watermark).values('user_id'))
+        total += rollup_rows(stats, started)
+    RollupRun.objects.create(started_at=started, rows=total)
+    return total
@@ -0,0 +1,45 @@
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def from_replica(queryset):
+    """Mark a read-only queryset as safe to serve from a replica.
+
+    The mark is a router hint, so it travels with the lazy queryset and is honoured whenever it is
+    evaluated. Without configured replicas it has no effect.
+    """
+    queryset._add_hints(replica=True)
+    return queryset
+
+
+class ReplicaRouter:
+    """Send reads marked with from_replica() to a random configured replica; everything else, and every
+    write, goes to the primary.
+
+    Inside a transaction on the primary, marked reads stay there too, so they see the transaction's
+    own uncommitted writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if hints.get('replica') and settings.DATABASE_REPLICAS and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Objects loaded from a replica would otherwise be saved back to it.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's rows, so objects loaded from any of them can be related.
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -1,7 +1,38 @@
 from rest_framework import serializers
-from django.contrib.auth.models import User
+from health_app.models import AppleHealthStat
+
+
+class RowSerializer(serializers.BaseSerializer):
+    """Read-only serializer for ``.values()`` rows.
+
+    ``fields`` maps each output key to the row key it is read from. There are no per-field objects
+    to build or run, so a row costs one dict comprehension. Extra ``fields`` can be passed per
+    instance, e.g. the term values of a cohort rule.
+    """
+    fields = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields = {**self.fields, **(fields or {})}
+
+    def to_representation(self, row):
+        return {key: row[source] for key, source in self.fields.items()}
+
+
+class UserSerializer(RowSerializer):
+    fields = {'user': 'username'}
+
+
+class AdviceSerializer(RowSerializer):
+    fields = {'user': 'username', 'ai_response': 'ai_response'}
+
+
+class AppleHealthStatIngestSerializer(serializers.ModelSerializer):
+    # Users are referenced by username and resolved in bulk by health_app.ingest.
+    user = serializers.CharField(max_length=150)
 
-class UserSerializer(serializers.ModelSerializer):
     class Meta:
-        model = User
-        fields = ['username']
+        model = AppleHealthStat
+        exclude = ['id', 'sleep_seconds', 'updated_at']
+        # Duplicates are upserted rather than rejected, and a per-row uniqueness query would defeat batching.
+        validators = []
@@ -0,0 +1,37 @@
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from health_app import llm, metrics
+from health_app.models import AppleHealthStat
+from health_app.rollups import refresh_daily_metrics
+
+
+@receiver(post_save, sender=AppleHealthStat)
+@receiver(post_delete, sender=AppleHealthStat)
+def update_daily_metrics(sender, instance, **kwargs):
+    # Keeps the rollup current for single-row writes; bulk loads run rollups.catch_up instead.
+    refresh_daily_metrics(instance.user_id, timezone.localdate(instance.created_at))
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Connections are reopened on the same wrapper object, which keeps its wrappers.
+    if metrics.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.record_query)
+
+
+# Settings the LLM backend and its transport are built from.
+LLM_SETTINGS = {
+    'OPENAI_API_KEY', 'OPENAI_BASE_URL', 'AI_LLM_BACKEND', 'AI_HTTP_POOL_SIZE', 'AI_HTTP_KEEPALIVE_EXPIRY',
+    'AI_CONNECT_TIMEOUT', 'AI_REQUEST_TIMEOUT',
+}
+
+
+@receiver(setting_changed)
+def rebuild_llm_backend(sender, setting, **kwargs):
+    # The backend is built once per process, so overridden settings (e.g. in tests) need a new one.
+    if setting in LLM_SETTINGS:
+        llm.reset_backend()
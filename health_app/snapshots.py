@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .advice import advise, llm_enabled, template_advice
+from .models import AdviceRefresh, AdviceSnapshot
+from .routers import from_replica
+from .summaries import summarized_items
+from .utils import advice_cache_key
+
+# Advice for the conditions is precomputed by manage.py refresh_advice and served from one row per
+# member, so reading a condition is a single indexed join whatever the LLM would have cost. Each
+# refresh re-reads the members' summaries (one aggregate query per chunk) and compares them with the
+# fingerprint stored on their snapshot: only members who joined the cohort or whose summary changed
+# are sent to the LLM, and members who left it lose their snapshot. LLM spend follows churn rather
+# than cohort size.
+
+
+def refresh(rule, chunk_size=None):
+    """Bring the snapshots of condition ``rule`` up to date; returns ``(members, regenerated, removed)``."""
+    chunk_size = chunk_size or settings.AI_JOB_CHUNK_SIZE
+    member_ids = list(rule.members().order_by('pk').values_list('pk', flat=True))
+    fingerprints = dict(AdviceSnapshot.objects.filter(rule=rule.name).values_list('user_id', 'fingerprint'))
+    # Template answers given because the LLM was unavailable are stored without a fingerprint, so the
+    # next refresh tries the LLM for them again.
+    fallback = template_advice(rule) if llm_enabled(rule) else None
+
+    User = get_user_model()
+    regenerated = 0
+    for start in range(0, len(member_ids), chunk_size):
+        items = summarized_items(User.objects.filter(pk__in=member_ids[start:start + chunk_size]))
+        keys = [advice_cache_key(user, data, rule.topic) for user, data in items]
+        changed = [(item, key) for item, key in zip(items, keys) if fingerprints.get(item[0].pk) != key]
+        if not changed:
+            continue
+        ai_responses = advise([item for item, _ in changed], rule)
+        now = timezone.now()
+        AdviceSnapshot.objects.bulk_create(
+            [
+                AdviceSnapshot(
+                    rule=rule.name, user=user, ai_response=ai_response, generated_at=now,
+                    fingerprint='' if fallback and ai_response == fallback(user, data) else key,
+                )
+                for ((user, data), key), ai_response in zip(changed, ai_responses)
+            ],
+            update_conflicts=True,
+            unique_fields=['rule', 'user'],
+            update_fields=['ai_response', 'fingerprint', 'generated_at'],
+        )
+        regenerated += len(changed)
+
+    members = set(member_ids)
+    departed = [user_id for user_id in fingerprints if user_id not in members]
+    with transaction.atomic():
+        for start in range(0, len(departed), chunk_size):
+            AdviceSnapshot.objects.filter(rule=rule.name, user_id__in=departed[start:start + chunk_size]).delete()
+        AdviceRefresh.objects.update_or_create(rule=rule.name, defaults={
+            'refreshed_at': timezone.now(), 'members': len(member_ids), 'regenerated': regenerated,
+        })
+    return len(member_ids), regenerated, len(departed)
+
+
+def _fresh(rule):
+    return from_replica(AdviceRefresh.objects.filter(
+        rule=rule.name, refreshed_at__gte=timezone.now() - timedelta(seconds=settings.ADVICE_MAX_AGE),
+    ))
+
+
+def latest_refresh(rule):
+    """The rule's last refresh if its snapshots are recent enough to serve, else None."""
+    return _fresh(rule).first()
+
+
+async def alatest_refresh(rule):
+    """latest_refresh() for async views."""
+    return await _fresh(rule).afirst()
+
+
+def age(refresh):
+    """Whole seconds since ``refresh``, for the ``Age`` header of responses served from it."""
+    return max(0, int((timezone.now() - refresh.refreshed_at).total_seconds()))
+
+
+def snapshot_rows(rule):
+    """The rule's snapshots as ``.values()`` rows with ``pk``, ``username``, ``ai_response`` and ``generated_at``."""
+    return from_replica(get_user_model().objects.filter(advice_snapshots__rule=rule.name).values(
+        'pk', 'username',
+        ai_response=F('advice_snapshots__ai_response'),
+        generated_at=F('advice_snapshots__generated_at'),
+    ).order_by('pk'))
@@ -0,0 +1,101 @@
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db.models import Avg, Count, FilteredRelation, Max, Q, Sum
+from django.utils import timezone
+
+from health_app.queries import start_of_day
+from health_app.routers import from_replica
+
+STEP_GOAL = 10000
+SLEEP_GOAL = 7 * 3600  # seconds
+
+# Feature name -> (AppleHealthStat field, divisor to the reported unit). Each is averaged over
+# the last 7 days (today included) and the 7 days before that.
+METRICS = {
+    'steps': ('stepCount', 1),
+    'sleep_hours': ('sleep_seconds', 3600),
+    'active_calories': ('activeEnergyBurned', 1),
+}
+
+
+def get_user_summaries(users):
+    """Annotate the users of a cohort queryset with their two-week features in one aggregate query.
+
+    Only the last 14 days are joined, through the (user, created_at) index, so the cost per user is
+    bounded no matter how long their history is.
+    """
+    today = timezone.now().date()
+    this_week = start_of_day(today - timedelta(days=6))
+    today_start = start_of_day(today)
+    yesterday_start = start_of_day(today - timedelta(days=1))
+
+    this_week_q = Q(recent__created_at__gte=this_week)
+    last_week_q = Q(recent__created_at__lt=this_week)
+
+    annotations = {}
+    for name, (field, _) in METRICS.items():
+        annotations[f'{name}_this_week'] = Avg(f'recent__{field}', filter=this_week_q)
+        annotations[f'{name}_last_week'] = Avg(f'recent__{field}', filter=last_week_q)
+
+    # Only the username is used downstream; loading no other user columns also keeps them out of the GROUP BY.
+    return from_replica(get_user_model().objects.filter(
+        pk__in=users.values('pk')
+    ).only('username').annotate(
+        recent=FilteredRelation(
+            'apple_health_stat',
+            condition=Q(apple_health_stat__created_at__gte=start_of_day(today - timedelta(days=13)))
+        ),
+        **annotations,
+        steps_today=Sum('recent__stepCount', filter=Q(recent__created_at__gte=today_start)),
+        steps_yesterday=Sum('recent__stepCount', filter=Q(recent__created_at__gte=yesterday_start, recent__created_at__lt=today_start)),
+        days_logged=Count('recent', filter=this_week_q),
+        # Streaks run from the most recent miss up to the latest record; rows are one per day.
+        last_logged=Max('recent__created_at'),
+        last_step_miss=Max('recent__created_at', filter=Q(recent__stepCount__lt=STEP_GOAL)),
+        last_sleep_miss=Max('recent__created_at', filter=Q(recent__sleep_seconds__lt=SLEEP_GOAL)),
+        recent_days=Count('recent'),
+    ).order_by('pk'))
+
+
+def _streak(last_logged, last_miss, recent_days):
+    if last_logged is None:
+        return 0
+    if last_miss is None:
+        return recent_days
+    return (last_logged.date() - last_miss.date()).days
+
+
+def _change_pct(current, previous):
+    if current is None or not previous:
+        return None
+    return round((current - previous) / previous * 100, 1)
+
+
+def summarize_user(user):
+    """Turn the annotations from get_user_summaries into a compact, fixed-size feature dict."""
+    summary = {}
+    for name, (_, divisor) in METRICS.items():
+        current = getattr(user, f'{name}_this_week')
+        previous = getattr(user, f'{name}_last_week')
+        summary[f'{name}_avg_7d'] = None if current is None else round(current / divisor, 1)
+        summary[f'{name}_avg_prev_7d'] = None if previous is None else round(previous / divisor, 1)
+        summary[f'{name}_change_pct'] = _change_pct(current, previous)
+
+    summary['steps_today'] = user.steps_today
+    summary['steps_yesterday'] = user.steps_yesterday
+    summary['days_logged_7d'] = user.days_logged
+    summary['step_goal_streak_days'] = _streak(user.last_logged, user.last_step_miss, user.recent_days)
+    summary['sleep_goal_streak_days'] = _streak(user.last_logged, user.last_sleep_miss, user.recent_days)
+    return summary
+
+
+def summarized_items(users):
+    """``(user, summary JSON)`` pairs for a cohort, ready for generate_ai_responses."""
+    return [(user, json.dumps(summarize_user(user))) for user in get_user_summaries(users)]
+
+
+async def asummarized_items(users):
+    """summarized_items() for async views."""
+    return [(user, json.dumps(summarize_user(user))) async for user in get_user_summaries(users)]
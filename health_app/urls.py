@@ -1,10 +1,19 @@
 # health_app/urls.py
 from django.urls import path
-from .views import AbsentUsersAPIView, SleepConditionAPIView, Steps1ConditionAPIView, Steps2ConditionAPIView
+from .views import AbsentUsersAPIView, AdviceJobAPIView, AsyncRuleView, BulkIngestAPIView, MetricsAPIView, RuleAPIView
 
 urlpatterns = [
-    path('sleep-condition/', SleepConditionAPIView.as_view(), name='sleep-condition'),
-    path('steps1-condition/', Steps1ConditionAPIView.as_view(), name='steps1-condition'),
-    path('steps2-condition/', Steps2ConditionAPIView.as_view(), name='steps2-condition'),
+    path('sleep-condition/', RuleAPIView.as_view(rule='sleep'), name='sleep-condition'),
+    path('steps1-condition/', RuleAPIView.as_view(rule='steps1'), name='steps1-condition'),
+    path('steps2-condition/', RuleAPIView.as_view(rule='steps2'), name='steps2-condition'),
+    path('cohorts/<str:rule>/', RuleAPIView.as_view(), name='cohort'),
+    # Async-native versions, for ASGI deployments.
+    path('async/sleep-condition/', AsyncRuleView.as_view(rule='sleep'), name='async-sleep-condition'),
+    path('async/steps1-condition/', AsyncRuleView.as_view(rule='steps1'), name='async-steps1-condition'),
+    path('async/steps2-condition/', AsyncRuleView.as_view(rule='steps2'), name='async-steps2-condition'),
+    path('async/cohorts/<str:rule>/', AsyncRuleView.as_view(), name='async-cohort'),
     path('absent-users/', AbsentUsersAPIView.as_view(), name='absent-users'),
+    path('jobs/<int:pk>/', AdviceJobAPIView.as_view(), name='advice-job'),
+    path('ingest/', BulkIngestAPIView.as_view(), name='ingest'),
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
 ]
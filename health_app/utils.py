@@ -1,17 +1,179 @@
 # utils.py
 
-import openai
-import os
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-openai.api_key = os.getenv('OPENAI_API_KEY')
-# print(f"API Key: {openai.api_key}")
-def generate_ai_response(user, data, topic):
+from django.conf import settings
+from django.core.cache import caches
+
+from . import llm, metrics
+
+
+class RateLimitGate:
+    """Shared pause point so that one 429 backs off every worker, not just the one that hit it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def pause(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def wait(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def await_resume(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+rate_limit_gate = RateLimitGate()
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling the LLM while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops sending work to the LLM after a run of failed or slow calls.
+
+    After ``AI_BREAKER_THRESHOLD`` bad calls in a row the circuit opens. For ``AI_BREAKER_COOLDOWN``
+    seconds no call is made, and then a single probe call is let through: it closes the circuit
+    again if it succeeds in time and reopens it otherwise.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def allowance(self):
+        """How many calls may start now: None (no limit) when closed, 1 for the probe, 0 while open.
+
+        Granting the probe claims it; a caller that ends up not sending it must release_probe().
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            if self._probing or time.monotonic() - self._opened_at < settings.AI_BREAKER_COOLDOWN:
+                return 0
+            self._probing = True
+            return 1
+
+    def release_probe(self):
+        """Hand back an unused probe slot, so the next caller may send the probe instead."""
+        with self._lock:
+            self._probing = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None and not self._probing
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self._failures, self._opened_at, self._probing = 0, None, False
+                return
+            self._failures += 1
+            if self._probing or self._failures >= settings.AI_BREAKER_THRESHOLD:
+                self._opened_at, self._probing = time.monotonic(), False
+
+    def guard(self, complete):
+        """Wrap ``complete(prompt, timeout)`` so calls fail fast while open and every outcome is recorded."""
+        def call(prompt, timeout):
+            if self.is_open:
+                raise CircuitOpen('LLM circuit breaker is open')
+            started = time.monotonic()
+            try:
+                response = complete(prompt, timeout)
+            except Exception:
+                self.record(False)
+                raise
+            self.record(time.monotonic() - started <= settings.AI_BREAKER_SLOW_SECONDS)
+            return response
+        return call
+
+    def aguard(self, complete):
+        """guard() for an async ``complete``."""
+        async def call(prompt, timeout):
+            if self.is_open:
+                raise CircuitOpen('LLM circuit breaker is open')
+            started = time.monotonic()
+            try:
+                response = await complete(prompt, timeout)
+            except Exception:
+                self.record(False)
+                raise
+            self.record(time.monotonic() - started <= settings.AI_BREAKER_SLOW_SECONDS)
+            return response
+        return call
+
+
+circuit_breaker = CircuitBreaker()
+
+
+class CallBudget:
+    """At most ``AI_LLM_BUDGET`` LLM calls per ``AI_LLM_BUDGET_WINDOW`` seconds in this process (0 is unlimited)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._used = 0
+
+    def take(self, wanted):
+        """Reserve up to ``wanted`` calls; returns how many were granted."""
+        if not settings.AI_LLM_BUDGET:
+            return wanted
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= settings.AI_LLM_BUDGET_WINDOW:
+                self._window_start, self._used = now, 0
+            granted = max(0, min(wanted, settings.AI_LLM_BUDGET - self._used))
+            self._used += granted
+            return granted
+
+
+call_budget = CallBudget()
+
+
+def _retry_after(error):
+    # Legacy openai errors carry .headers; v1 errors carry .response.headers.
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None) or {}
     try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_rate_limited(error):
+    status_code = getattr(error, 'http_status', None) or getattr(error, 'status_code', None)
+    return status_code == 429 or type(error).__name__ == 'RateLimitError'
+
+
+# Bump whenever build_prompt changes so cached advice from the old template is not served.
+PROMPT_VERSION = 1
+
 
-        prompt = f"""
+def advice_cache_key(user, data, topic):
+    payload = json.dumps([PROMPT_VERSION, topic, user.username, str(data)])
+    return 'advice:' + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def build_prompt(user, data, topic):
+    return f"""
         you are a health assistant providing personalized feedback. Based on the following data, generate a friendly and motivational message for the user.
 
-        
+
         User: {user.username}
         Data: {data}
         topic: {topic}
@@ -20,14 +182,183 @@ def generate_ai_response(user, data, topic):
         Example Response format:
         "Hello, [name]. I see that you walked [stepCount] steps today, which is 4,000 more than yesterday. It's great that you are so active! I noticed that on days when you walk a lot, you sleep 20% better. Keep it up and continue in the same spirit to reach your goal."
         """
-        response = openai.ChatCompletion.create(
-
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {"role": "system", "content": "You are a health advisor."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message['content'].strip()
-    except Exception as e:
-        return f"AI generation faild: {str(e)}"
+
+
+def chat_completion(prompt, timeout):
+    return llm.get_backend().complete(prompt, timeout)
+
+
+async def achat_completion(prompt, timeout):
+    return await llm.get_backend().acomplete(prompt, timeout)
+
+
+def complete_with_retry(prompt, complete=None):
+    """Run one completion with a per-request timeout, retrying transient failures with jittered backoff.
+
+    ``complete`` is any callable ``(prompt, timeout) -> str``; it defaults to the OpenAI API and
+    lets tests substitute a stub client.
+    """
+    complete = complete or chat_completion
+    attempt = 0
+    while True:
+        rate_limit_gate.wait()
+        try:
+            return complete(prompt, settings.AI_REQUEST_TIMEOUT)
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            attempt += 1
+            if attempt > settings.AI_MAX_RETRIES:
+                raise
+            delay = settings.AI_RETRY_BACKOFF * 2 ** (attempt - 1) * (1 + random.random())
+            if _is_rate_limited(e):
+                rate_limit_gate.pause(_retry_after(e) or delay)
+            else:
+                time.sleep(delay)
+
+
+async def acomplete_with_retry(prompt, complete=None):
+    """complete_with_retry() for an async ``complete(prompt, timeout)``; waits without blocking the event loop."""
+    complete = complete or achat_completion
+    attempt = 0
+    while True:
+        await rate_limit_gate.await_resume()
+        try:
+            return await complete(prompt, settings.AI_REQUEST_TIMEOUT)
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            attempt += 1
+            if attempt > settings.AI_MAX_RETRIES:
+                raise
+            delay = settings.AI_RETRY_BACKOFF * 2 ** (attempt - 1) * (1 + random.random())
+            if _is_rate_limited(e):
+                rate_limit_gate.pause(_retry_after(e) or delay)
+            else:
+                await asyncio.sleep(delay)
+
+
+def generate_ai_response(user, data, topic, complete=None):
+    return generate_ai_responses([(user, data)], topic, complete)[0]
+
+
+def _plan(items, topic, cached, fallback):
+    """Split the cache misses into ``(key, prompt)`` pairs for the LLM and keys answered by ``fallback``.
+
+    Without a fallback every miss goes to the LLM. With one, only as many as the circuit breaker and
+    the call budget allow do; the rest are answered from the fallback straight away.
+    """
+    misses = [(key, user, data) for key, (user, data) in items.items() if key not in cached]
+    metrics.ai_cache_hits.inc(len(items) - len(misses))
+    metrics.ai_cache_misses.inc(len(misses))
+    if fallback is None:
+        return [(key, build_prompt(user, data, topic)) for key, user, data in misses], {}
+
+    if not misses:
+        return [], {}
+    allowance = circuit_breaker.allowance()
+    wanted = len(misses) if allowance is None else min(allowance, len(misses))
+    sent = call_budget.take(wanted)
+    if allowance and not sent:
+        # The budget refused the probe; no call will record an outcome for it.
+        circuit_breaker.release_probe()
+    if wanted < len(misses):
+        metrics.ai_template_responses.inc(len(misses) - wanted, reason='breaker')
+    if sent < wanted:
+        metrics.ai_template_responses.inc(wanted - sent, reason='budget')
+    skipped = {key: fallback(user, data) for key, user, data in misses[sent:]}
+    return [(key, build_prompt(user, data, topic)) for key, user, data in misses[:sent]], skipped
+
+
+def _finish(items, cached, outcomes, fallback):
+    """Merge cached, generated and fallback advice in input order, caching only what the LLM wrote."""
+    generated, failed = {}, {}
+    for key, (response, error) in outcomes:
+        if error is None:
+            generated[key] = response
+        elif fallback is not None:
+            failed[key] = fallback(*items[key])
+            metrics.ai_template_responses.inc(reason='error')
+        else:
+            failed[key] = error
+    return generated, {**cached, **generated, **failed}
+
+
+def generate_ai_responses(items, topic, complete=None, fallback=None):
+    """Generate advice for many ``(user, data)`` pairs concurrently, returning responses in input order.
+
+    Advice is looked up first in the ``ai_responses`` cache, keyed on a hash of the prompt version,
+    topic, user and data, so unchanged users cost nothing. Prompts for the misses are built in the
+    calling thread, so lazy querysets in ``data`` are evaluated on the request's own database
+    connection; only the LLM calls run on the bounded worker pool.
+
+    ``fallback`` is a ``(user, data) -> str`` used instead of the LLM when the circuit breaker or the
+    call budget holds it back and in place of an error message when it fails (see
+    health_app.advice); fallback text is not cached.
+    """
+    if not items:
+        return []
+
+    cache = caches['ai_responses']
+    keys = [advice_cache_key(user, data, topic) for user, data in items]
+    keyed = dict(zip(keys, items))
+    cached = cache.get_many(keys)
+    prompts, skipped = _plan(keyed, topic, cached, fallback)
+
+    outcomes = []
+    if prompts:
+        complete = complete or chat_completion
+        if fallback is not None:
+            complete = circuit_breaker.guard(complete)
+        complete = metrics.timed_completion(complete)
+
+        def generate(prompt):
+            try:
+                return complete_with_retry(prompt, complete), None
+            except Exception as e:
+                return None, f"AI generation faild: {str(e)}"
+
+        with ThreadPoolExecutor(max_workers=min(settings.AI_MAX_CONCURRENCY, len(prompts))) as pool:
+            outcomes = list(zip((key for key, _ in prompts), pool.map(lambda miss: generate(miss[1]), prompts)))
+
+    # Only successful completions are cached; failures are retried on the next request.
+    generated, results = _finish(keyed, {**cached, **skipped}, outcomes, fallback)
+    cache.set_many(generated)
+    return [results[key] for key in keys]
+
+
+async def agenerate_ai_responses(items, topic, complete=None, fallback=None):
+    """generate_ai_responses() for async views.
+
+    The LLM calls are tasks on the event loop, at most ``AI_MAX_CONCURRENCY`` in flight, so a
+    request waiting on the LLM holds no thread. ``complete`` is an async ``(prompt, timeout) -> str``.
+    """
+    if not items:
+        return []
+
+    cache = caches['ai_responses']
+    keys = [advice_cache_key(user, data, topic) for user, data in items]
+    keyed = dict(zip(keys, items))
+    cached = await cache.aget_many(keys)
+    prompts, skipped = _plan(keyed, topic, cached, fallback)
+
+    outcomes = []
+    if prompts:
+        complete = complete or achat_completion
+        if fallback is not None:
+            complete = circuit_breaker.aguard(complete)
+        complete = metrics.timed_acompletion(complete)
+        slots = asyncio.Semaphore(settings.AI_MAX_CONCURRENCY)
+
+        async def generate(prompt):
+            async with slots:
+                try:
+                    return await acomplete_with_retry(prompt, complete), None
+                except Exception as e:
+                    return None, f"AI generation faild: {str(e)}"
+
+        outcomes = list(zip((key for key, _ in prompts), await asyncio.gather(*(generate(prompt) for _, prompt in prompts))))
+
+    generated, results = _finish(keyed, {**cached, **skipped}, outcomes, fallback)
+    await cache.aset_many(generated)
+    return [results[key] for key in keys]
@@ -1,79 +1,262 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from health_app.models import AppleHealthStat
-from .queries import get_absent_users, get_users_with_less_sleep, get_users_with_10000_steps_today, get_users_with_50_percent_less_steps
-from .utils import generate_ai_response
-from django.core.serializers import serialize
-import json
+from rest_framework.exceptions import MethodNotAllowed, NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.permissions import IsAdminUser
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from health_app.models import AdviceJob
+from .advice import aadvise, advise, render
+from .conditions import RULES
+from .ingest import ingest, parse_export_xml, parse_ndjson
+from .queries import aiter_chunks, iter_chunks, pk_chunks
+from .renderers import dumps, ndjson_line
+from .serializers import AdviceSerializer, UserSerializer
+from .snapshots import age, alatest_refresh, latest_refresh, snapshot_rows
+from .summaries import asummarized_items, summarized_items
+from . import metrics
 
 
-class SleepConditionAPIView(APIView):
-    def get(self, request):
-        users = get_users_with_less_sleep()
-        responses = []
-        for user in users:
-            datas = AppleHealthStat.objects.filter(user=user)
-            
-            json_data = serialize('json', datas)
+class UserCursorPagination(CursorPagination):
+    ordering = 'pk'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
 
-            ai_response = generate_ai_response(user, json_data, "Users with a week of sleep less than 6 hours.")
-            responses.append({"user": user.username, "ai_response": ai_response})
-        
-        return Response(responses, status=status.HTTP_200_OK)
 
-class Steps1ConditionAPIView(APIView):
-    def get(self, request):
-        users = get_users_with_10000_steps_today()
-        responses = []
-        for user in users:
-            data = AppleHealthStat.objects.filter(user=user)
-            ai_response = generate_ai_response(user, data, "Users who have reached 10,000 steps today.")
-            responses.append({"user": user.username, "ai_response": ai_response})
-        return Response(responses, status=status.HTTP_200_OK)
+class CohortAPIView(APIView):
+    """Shared response modes for the cohort endpoints.
 
-class Steps2ConditionAPIView(APIView):
-    def get(self, request):
-        users = get_users_with_50_percent_less_steps()
-        responses = []
-        for user in users:
-            data = user.apple_health_stat.all()
-            ai_response = generate_ai_response(user, data, "Users who walked 50%\ less this week compared to the previous week.")
-            responses.append({"user": user.username, "ai_response": ai_response})
-        return Response(responses, status=status.HTTP_200_OK)
+    By default the whole cohort is returned as one list. Passing ``cursor`` or ``page_size`` switches to
+    cursor pagination keyed on user id, and ``stream=true`` streams NDJSON, one user per line, as each
+    chunk of users is processed.
+    """
+
+    stream_chunk_size = 500
+
+    def get_users(self):
+        """The cohort as ``.values()`` rows, which must include ``pk``."""
+        raise NotImplementedError
+
+    def respond(self, users):
+        """Turn a list of cohort rows into their response entries."""
+        raise NotImplementedError
+
+    def get(self, request, **kwargs):
+        users = self.get_users()
+        if request.query_params.get('stream') in ('1', 'true'):
+            return StreamingHttpResponse(self.stream(users), content_type='application/x-ndjson')
+        if 'cursor' in request.query_params or 'page_size' in request.query_params:
+            paginator = UserCursorPagination()
+            page = paginator.paginate_queryset(users, request, view=self)
+            return paginator.get_paginated_response(self.respond(page))
+        return Response(self.respond(list(users)), status=status.HTTP_200_OK)
+
+    def stream(self, users):
+        for chunk in iter_chunks(users, self.stream_chunk_size):
+            for entry in self.respond(chunk):
+                yield ndjson_line(entry)
+
+
+class RuleAPIView(CohortAPIView):
+    """Serve any registered cohort rule, by name from the URL or the ``rule`` view attribute.
+
+    Conditions (rules with a topic) get LLM advice: GET serves the snapshots kept by manage.py
+    refresh_advice, with each entry's ``generated_at`` and the refresh's age in the ``Age`` header, or
+    generates it synchronously when there is no recent refresh; POST queues it as a background job.
+    Other rules list their members with the rule's annotated values.
+    """
+    rule = None
+    refresh = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        name = kwargs.get('rule', self.rule)
+        if name not in RULES:
+            raise NotFound(f"Unknown cohort rule '{name}'.")
+        self.cohort_rule = RULES[name]
+
+    @property
+    def stream_chunk_size(self):
+        # One chunk fills the LLM worker pool, so the first lines arrive after a single round trip.
+        live_advice = self.cohort_rule.topic and not self.refresh
+        return settings.AI_MAX_CONCURRENCY if live_advice else CohortAPIView.stream_chunk_size
+
+    def get(self, request, **kwargs):
+        self.refresh = latest_refresh(self.cohort_rule) if self.cohort_rule.topic else None
+        response = super().get(request, **kwargs)
+        if self.refresh:
+            response['Age'] = age(self.refresh)
+        return response
+
+    def get_users(self):
+        if self.refresh:
+            return snapshot_rows(self.cohort_rule)
+        # Conditions only need the ids, which are re-read with their summaries.
+        fields = ['pk'] if self.cohort_rule.topic else ['pk', 'username']
+        return self.cohort_rule.members(fields=fields)
+
+    def respond(self, users):
+        if self.refresh:
+            return AdviceSerializer(users, many=True, fields={'generated_at': 'generated_at'}).data
+        if not self.cohort_rule.topic:
+            terms = {name: name for name in self.cohort_rule.terms}
+            return UserSerializer(users, many=True, fields=terms).data
+        # The list mode passes the whole cohort; its summaries are read a bounded id list at a time.
+        items = []
+        for pks in pk_chunks(users, CohortAPIView.stream_chunk_size):
+            items += summarized_items(get_user_model().objects.filter(pk__in=pks))
+        ai_responses = advise(items, self.cohort_rule)
+        return AdviceSerializer([
+            {'username': user.username, 'ai_response': ai_response}
+            for (user, _), ai_response in zip(items, ai_responses)
+        ], many=True).data
+
+    def post(self, request, **kwargs):
+        if not self.cohort_rule.topic:
+            raise MethodNotAllowed(request.method)
+        job = AdviceJob.objects.create(condition=self.cohort_rule.name)
+        return Response(
+            {"job": job.pk, "status": job.status, "url": reverse('advice-job', args=[job.pk])},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class AsyncRuleView(View):
+    """Async-native GET for the cohort rules, with RuleAPIView's list and ``stream=true`` modes and snapshots.
+
+    Cohort rows come from the async ORM and advice from the async OpenAI client, so a request
+    waiting on the database or the LLM holds no thread and one ASGI worker can serve many of them.
+    DRF views are synchronous, so this is a plain Django view rendering with the same orjson encoder.
+    """
+    rule = None
+
+    async def get(self, request, **kwargs):
+        name = kwargs.get('rule', self.rule)
+        if name not in RULES:
+            return self.json({"detail": f"Unknown cohort rule '{name}'."}, status=status.HTTP_404_NOT_FOUND)
+        rule = RULES[name]
+        refresh = await alatest_refresh(rule) if rule.topic else None
+        if refresh:
+            response = await self.serve(request, rule, snapshot_rows(rule), snapshots=True)
+            response['Age'] = age(refresh)
+            return response
+        fields = ['pk'] if rule.topic else ['pk', 'username']
+        return await self.serve(request, rule, await rule.amembers(fields=fields))
+
+    async def serve(self, request, rule, users, snapshots=False):
+        if request.GET.get('stream') in ('1', 'true'):
+            return StreamingHttpResponse(self.stream(rule, users, snapshots), content_type='application/x-ndjson')
+        return self.json(await self.respond(rule, [user async for user in users.aiterator()], snapshots))
+
+    def chunk_size(self, rule, snapshots=False):
+        # Streamed conditions are answered in chunks that fill the LLM concurrency limit, as in RuleAPIView.
+        return settings.AI_MAX_CONCURRENCY if rule.topic and not snapshots else CohortAPIView.stream_chunk_size
+
+    async def respond(self, rule, users, snapshots=False):
+        if snapshots:
+            return AdviceSerializer(users, many=True, fields={'generated_at': 'generated_at'}).data
+        if not rule.topic:
+            return UserSerializer(users, many=True, fields={name: name for name in rule.terms}).data
+        items = []
+        for pks in pk_chunks(users, CohortAPIView.stream_chunk_size):
+            items += await asummarized_items(get_user_model().objects.filter(pk__in=pks))
+        ai_responses = await aadvise(items, rule)
+        return AdviceSerializer([
+            {'username': user.username, 'ai_response': ai_response}
+            for (user, _), ai_response in zip(items, ai_responses)
+        ], many=True).data
+
+    async def stream(self, rule, users, snapshots=False):
+        async for chunk in aiter_chunks(users, self.chunk_size(rule, snapshots)):
+            for entry in await self.respond(rule, chunk, snapshots):
+                yield ndjson_line(entry)
+
+    def json(self, data, status=status.HTTP_200_OK):
+        return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+class AdviceResultPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+class AdviceJobAPIView(APIView):
+    def get(self, request, pk):
+        job = get_object_or_404(AdviceJob, pk=pk)
+        paginator = AdviceResultPagination()
+        results = job.results.order_by('user_id').values('ai_response', username=F('user__username'))
+        page = paginator.paginate_queryset(results, request, view=self)
+        return Response({
+            "job": job.pk,
+            "condition": job.condition,
+            "status": job.status,
+            "total": job.total,
+            "processed": job.processed,
+            "error": job.error,
+            "results": paginator.get_paginated_response(AdviceSerializer(page, many=True).data).data,
+        }, status=status.HTTP_200_OK)
     
 
-class AbsentUsersAPIView(APIView):
-    def get(self, request):
-        absent_users = get_absent_users()
+class AbsentUsersAPIView(CohortAPIView):
+    def get_users(self):
+        return RULES['absent'].members(fields=['pk', 'username', 'date_joined'])
+
+    def respond(self, users):
         responses = []
 
-        for username, days_absent in absent_users.items():
+        # Totals are annotated on the queryset, so this loop issues no further queries.
+        today = timezone.localdate()
+        for user in users:
+            # Users who never synced have been absent since they joined.
+            days_absent = (today - (user['last_seen'] or timezone.localdate(user['date_joined']))).days
             if days_absent == 0 or days_absent % 30 != 0: continue
 
-            user = get_user_model().objects.get(username=username)
-            data = AppleHealthStat.objects.filter(user=user)
-            
-            # Summing up the total steps, calories burned, and perfect sleep nights
-            total_steps = data.aggregate(Sum('stepCount'))['stepCount__sum'] or 0
-            total_calories = data.aggregate(Sum('activeEnergyBurned'))['activeEnergyBurned__sum'] or 0
-            perfect_sleep_nights = sum(
-                1 for stat in data if stat.sleepAnalysis[0]['sleep_time'] >= 8 * 3600
-            )
-
-            # Generate the message
-            message = (
-                f"It’s been {days_absent} days since we last saw you. During this period that you were with us "
-                f"you walked more than {total_steps} steps, burned {total_calories} calories and had "
-                f"{perfect_sleep_nights} nights of perfect sleep. Your wellness journey is important to us, "
-                f"continue the path to self-improvement in Hapday. Let’s catch up!"
-            )
-            
+            message = render(RULES['absent'].template, {**user, 'days_absent': days_absent})
+
             responses.append({
-                "user": user.username,
+                "user": user['username'],
                 "message": message
             })
 
-        return Response(responses, status=status.HTTP_200_OK)
+        return responses
+
+
+class MetricsAPIView(APIView):
+    # Prometheus text exposition format, so it bypasses DRF rendering.
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
+
+
+class BulkIngestAPIView(APIView):
+    """Bulk-load health data from the request body.
+
+    NDJSON (one AppleHealthStat record per line) by default; an Apple Health ``export.xml`` when the
+    body is XML, in which case ``?user=`` names the user it belongs to. The body is read as a stream.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        try:
+            batch_size = int(request.query_params.get('batch_size', 1000))
+        except ValueError:
+            batch_size = 0
+        if batch_size <= 0:
+            return Response({"detail": "batch_size must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if 'xml' in request.content_type:
+            username = request.query_params.get('user')
+            if not username:
+                return Response({"detail": "An export.xml upload needs ?user=<username>."}, status=status.HTTP_400_BAD_REQUEST)
+            records = parse_export_xml(request.stream, username)
+        else:
+            records = parse_ndjson(request.stream or [])
+        result = ingest(records, batch_size=batch_size)
+        # An unreadable body is a client error; the counts show what was loaded before it.
+        return Response(result.as_dict(), status=status.HTTP_400_BAD_REQUEST if result.error else status.HTTP_200_OK)